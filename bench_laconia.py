@@ -0,0 +1,322 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+bench_laconia.py - benchmarks for laconia's hot paths
+
+Builds synthetic graphs of people (with an OWL schema of functional
+properties, cardinality restrictions and rdf:List/rdf:Seq ranges) at each
+requested size and times the common Thing and ResourceSet operations on them.
+
+E.g.,
+  python bench_laconia.py --sizes 1000,100000 --save baseline.json
+  (change something)
+  python bench_laconia.py --sizes 1000,100000 --compare baseline.json
+
+Sizes up to 10^7 statements work, given the memory; --store compact keeps
+large graphs in a CompactStore rather than rdflib's Memory store.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+import rdflib
+from rdflib import Graph, Literal, Namespace, RDF, RDFS, OWL, XSD
+
+import laconia
+from laconia import ThingFactory, CompactStore
+
+try:
+    clock = time.perf_counter
+except AttributeError:
+    clock = time.time
+
+
+BENCH = Namespace('http://example.com/bench#')
+BENCH_FORMAT = 'laconia-bench-1'
+# Roughly how many statements generate_graph() writes per person
+TRIPLES_PER_PERSON = 12
+LANGUAGES = ('en', 'fr', 'de')
+
+
+def generate_schema():
+    """
+    Build the OWL schema the benchmark graphs use: bench_name and bench_age
+    are functional (the latter through a maxCardinality restriction on
+    bench_Person), and so are bench_todo and bench_playlist, which range over
+    rdf:List and rdf:Seq.
+
+    returns rdflib.Graph instance
+    """
+    schema = Graph()
+    schema.add((BENCH.name, RDF.type, OWL.FunctionalProperty))
+    schema.add((BENCH.age, RDFS.range, XSD.int))
+    schema.add((BENCH.todo, RDF.type, OWL.FunctionalProperty))
+    schema.add((BENCH.playlist, RDF.type, OWL.FunctionalProperty))
+    schema.add((BENCH.todo, RDFS.range, RDF.List))
+    schema.add((BENCH.playlist, RDFS.range, RDF.Seq))
+    restriction = rdflib.BNode()
+    schema.add((restriction, RDF.type, OWL.Restriction))
+    schema.add((restriction, OWL.onProperty, BENCH.age))
+    # Plain "1", as laconia.ONE, which is what laconia recognises
+    schema.add((restriction, OWL.maxCardinality, Literal('1')))
+    schema.add((BENCH.Person, RDFS.subClassOf, restriction))
+    return schema
+
+
+def generate_graph(num_triples, seed=0, store=None):
+    """
+    Build a graph of about num_triples statements describing people, each
+    with a name, an age, labels in several languages, interests and people
+    they know.
+
+    num_triples - int approximate size
+    seed - int seed for the random choices
+    store - rdflib store to build the graph on (a Memory store by default)
+
+    returns rdflib.Graph instance
+    """
+    rnd = random.Random(seed)
+    graph = Graph(store=store) if store is not None else Graph()
+    graph.bind('bench', BENCH)
+    num_people = max(num_triples // TRIPLES_PER_PERSON, 2)
+    chunk = []
+    for i in range(num_people):
+        person = BENCH['person%d' % i]
+        chunk.extend([
+            (person, RDF.type, BENCH.Person),
+            (person, BENCH.name, Literal('Person %d' % i)),
+            (person, BENCH.age, Literal(rnd.randint(1, 99))),
+        ])
+        for lang in LANGUAGES:
+            chunk.append((person, RDFS.label, Literal('Label %d' % i, lang=lang)))
+        for _ in range(3):
+            chunk.append((person, BENCH.knows, BENCH['person%d' % rnd.randrange(num_people)]))
+        for _ in range(3):
+            chunk.append((person, BENCH.likes, Literal('Interest %d' % rnd.randrange(100))))
+        if len(chunk) >= laconia.COPY_BATCH_SIZE:
+            graph.addN((s, p, o, graph) for (s, p, o) in chunk)
+            chunk = []
+    graph.addN((s, p, o, graph) for (s, p, o) in chunk)
+    return graph
+
+
+def _people(context):
+    factory, uris = context['factory'], context['uris']
+    return [factory(uri) for uri in uris]
+
+
+def bench_getattr_functional(context):
+    for person in _people(context):
+        person.bench_name
+
+
+def bench_getattr_restricted(context):
+    for person in _people(context):
+        person.bench_age
+
+
+def bench_getattr_multi(context):
+    for person in _people(context):
+        list(person.bench_likes)
+
+
+def bench_setattr(context):
+    for (i, person) in enumerate(_people(context)):
+        person.bench_name = 'Renamed %d' % i
+
+
+def bench_resource_set_iter_lang(context):
+    for person in _people(context):
+        person.lang = 'fr'
+        list(person.rdfs_label)
+
+
+def bench_resource_set_len(context):
+    for person in _people(context):
+        len(person.bench_knows)
+
+
+def bench_resource_set_contains_lang(context):
+    for person in _people(context):
+        person.lang = 'en'
+        'Nothing' in person.rdfs_label
+
+
+def bench_inverse_access(context):
+    for person in _people(context):
+        list(person.bench_knows_of)
+
+
+def bench_list_round_trip(context):
+    items = ['item %d' % i for i in range(20)]
+    for person in _people(context):
+        person.bench_todo = items
+        list(person.bench_todo)
+
+
+def bench_seq_round_trip(context):
+    items = ['track %d' % i for i in range(20)]
+    for person in _people(context):
+        person.bench_playlist = items
+        list(person.bench_playlist)
+
+
+def bench_copy_to(context):
+    for person in _people(context):
+        person.copyTo(Graph(), depth=1)
+
+
+def bench_properties(context):
+    for person in _people(context):
+        person.properties()
+
+
+# (name, function, whether it writes to the graph)
+BENCHMARKS = [
+    ('getattr_functional', bench_getattr_functional, False),
+    ('getattr_restricted', bench_getattr_restricted, False),
+    ('getattr_multi', bench_getattr_multi, False),
+    ('setattr', bench_setattr, True),
+    ('resource_set_iter_lang', bench_resource_set_iter_lang, False),
+    ('resource_set_len', bench_resource_set_len, False),
+    ('resource_set_contains_lang', bench_resource_set_contains_lang, False),
+    ('inverse_access', bench_inverse_access, False),
+    ('list_round_trip', bench_list_round_trip, True),
+    ('seq_round_trip', bench_seq_round_trip, True),
+    ('copy_to', bench_copy_to, False),
+    ('properties', bench_properties, False),
+]
+
+
+def run(sizes, repeat=3, ops=200, store='memory', names=None, seed=0):
+    """
+    Time each benchmark against a graph of each size. The benchmarks that
+    only read share one generated graph per size, each with its own factory,
+    and one that writes gets a freshly generated graph for each run, so that
+    no timing depends on what ran before it.
+
+    sizes - list of int graph sizes, in statements
+    repeat - int times to run each benchmark, keeping the fastest
+    ops - int Things each benchmark touches per run
+    store - 'memory' or 'compact', the store the graphs are built on
+    names - list of benchmark names to run, or None for all of them
+    seed - int seed for the graph and the Things chosen
+
+    returns dict of benchmark name to dict of str size to seconds per Thing
+    """
+    results = {}
+    for size in sizes:
+        rnd = random.Random(seed)
+        num_people = max(size // TRIPLES_PER_PERSON, 2)
+        uris = [BENCH['person%d' % rnd.randrange(num_people)] for _ in range(ops)]
+        shared = None
+        for (name, bench, writes) in BENCHMARKS:
+            if names and name not in names:
+                continue
+            if not writes:
+                if shared is None:
+                    shared = _graph(size, seed, store)
+                context = _context(shared, uris)
+            best = None
+            for _ in range(repeat):
+                if writes:
+                    context = _context(_graph(size, seed, store), uris)
+                start = clock()
+                bench(context)
+                elapsed = clock() - start
+                best = elapsed if best is None else min(best, elapsed)
+            results.setdefault(name, {})[str(size)] = best / ops
+    return results
+
+
+def _graph(size, seed, store):
+    return generate_graph(size, seed, CompactStore() if store == 'compact' else None)
+
+
+def _context(graph, uris):
+    # The schema graph is never changed once built, so it can be compiled
+    factory = ThingFactory(graph, generate_schema(), compile_schema=True)
+    return {'graph': graph, 'factory': factory, 'uris': uris}
+
+
+def save(results, path):
+    """
+    Write results from run() to a JSON baseline file.
+    """
+    data = {
+        'format': BENCH_FORMAT,
+        'python': platform.python_version(),
+        'rdflib': rdflib.__version__,
+        'results': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+
+
+def compare(results, path, tolerance=0.2):
+    """
+    Compare results from run() with a baseline file written by save().
+
+    tolerance - float fraction by which a benchmark may slow down before it
+    counts as a regression
+
+    returns list of (name, size, baseline seconds, seconds, ratio) tuples,
+    one per benchmark and size in both, and list of those that regressed
+    """
+    with open(path) as f:
+        data = json.load(f)
+    if data.get('format') != BENCH_FORMAT:
+        raise ValueError('Not a laconia benchmark baseline: %s' % path)
+    rows = []
+    for (name, by_size) in sorted(results.items()):
+        for (size, seconds) in sorted(by_size.items(), key=lambda item: int(item[0])):
+            before = data['results'].get(name, {}).get(size)
+            if before:
+                rows.append((name, size, before, seconds, seconds / before))
+    return rows, [row for row in rows if row[4] > 1 + tolerance]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark laconia hot paths.')
+    parser.add_argument('--sizes', default='1000,10000',
+                        help='comma-separated graph sizes in statements (default 1000,10000)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--ops', type=int, default=200, help='Things touched per run')
+    parser.add_argument('--store', choices=['memory', 'compact'], default='memory')
+    parser.add_argument('--only', help='comma-separated benchmark names')
+    parser.add_argument('--save', metavar='FILE', help='write results as a JSON baseline')
+    parser.add_argument('--compare', metavar='FILE', help='compare with a JSON baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    sizes = [int(float(size)) for size in args.sizes.split(',')]
+    names = args.only.split(',') if args.only else None
+    results = run(sizes, args.repeat, args.ops, args.store, names)
+
+    for (name, by_size) in sorted(results.items()):
+        for (size, seconds) in sorted(by_size.items(), key=lambda item: int(item[0])):
+            print('%-28s %10s %12.2f us' % (name, size, seconds * 1e6))
+    if args.save:
+        save(results, args.save)
+    if args.compare and not os.path.exists(args.compare):
+        print('\nNo baseline at %s yet; saved these results as one.' % args.compare)
+        save(results, args.compare)
+    elif args.compare:
+        rows, regressions = compare(results, args.compare, args.tolerance)
+        print('')
+        for (name, size, before, seconds, ratio) in rows:
+            print('%-28s %10s %12.2f us -> %10.2f us  x%.2f%s' % (
+                name, size, before * 1e6, seconds * 1e6, ratio,
+                '  REGRESSED' if (name, size, before, seconds, ratio) in regressions else ''))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,7 @@
 #!/usr/bin/env python
 
+from __future__ import print_function
+
 from laconia import ThingFactory
 from rdflib import Graph
 
@@ -43,18 +45,18 @@ bob.person_childname.add("joe")
 bob.person_childname.add("jim")
 bob.person_childname.add("bob")
 if "jim" in bob.person_childname:
-    print "Yes, Bob has a child named jim."
+    print("Yes, Bob has a child named jim.")
 if "george" not in bob.person_childname:
-    print "But he doesn't have one named george."
+    print("But he doesn't have one named george.")
 bob.person_childname.remove("jim")
 if "jim" not in bob.person_childname:
-    print "And in fact, jim isn't any more."
+    print("And in fact, jim isn't any more.")
 bob.person_childname.discard("nonexistant")
 
 bob.person_employment_history = ["7-11", "Wal-Mart", "Goldman Sachs"]
 
 bob.special.add("testing...")
-print "This should be 1:", len(bob.special)
+print("This should be 1:", len(bob.special))
 
 mary = Thing("person_mary",
              person_name="Mary",
@@ -65,32 +67,32 @@ mary = Thing("person_mary",
 bob.person_wife = mary
 
 mary.person_childname = bob.person_childname
-print "Mary has", len(mary.person_childname), "kids."
+print("Mary has", len(mary.person_childname), "kids.")
 
 mary.contact_phone = "123-4567"
 bob.person_wife.contact_www = "http://www.example.org/~mary"
 
-print "Bob's phone is", bob.contact_phone
-# print "Bob's zip code is", bob.contact_address.contact_zip
-print "Bob's wife is", bob.person_wife.person_name
-print "Mary's phone is", mary.contact_phone
-print "Bob's wife's phone is", bob.person_wife.contact_phone
-print "Mary's web site is", mary.contact_www
-print "their", len(bob.person_childname), "kids' names are:"
-for kid in bob.person_childname: print "  ", kid
-print "Bob has worked at:", bob.person_employment_history
-
-print "Mary's age is", mary.person_age
+print("Bob's phone is", bob.contact_phone)
+# print("Bob's zip code is", bob.contact_address.contact_zip)
+print("Bob's wife is", bob.person_wife.person_name)
+print("Mary's phone is", mary.contact_phone)
+print("Bob's wife's phone is", bob.person_wife.contact_phone)
+print("Mary's web site is", mary.contact_www)
+print("their", len(bob.person_childname), "kids' names are:")
+for kid in bob.person_childname: print("  ", kid)
+print("Bob has worked at:", bob.person_employment_history)
+
+print("Mary's age is", mary.person_age)
 bob.person_age = bob.person_wife.person_age + 4
-print "Bob's age is", bob.person_age, type(bob.person_age)
+print("Bob's age is", bob.person_age, type(bob.person_age))
 
 f = open('/dev/random')
 bob.person_picture.add(f.read(25))
 f.close()
 
-print "Bob's properties:", ", ".join(map(str, bob.properties()))
-print "Bob has a wife?", hasattr(bob, "person_wife")
-print "Her name?", getattr(bob, "person_wife").person_name
+print("Bob's properties:", ", ".join(map(str, bob.properties())))
+print("Bob has a wife?", hasattr(bob, "person_wife"))
+print("Her name?", getattr(bob, "person_wife").person_name)
 
-print
-print store.serialize(format="xml")
+print()
+print(store.serialize(format="xml"))
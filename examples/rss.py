@@ -1,5 +1,7 @@
 #!/usr/bin/env python
 
+from __future__ import print_function
+
 from rdflib import Graph
 from rdflib import URIRef as URI
 from laconia import ThingFactory
@@ -14,9 +16,9 @@ def main(rss_url, blog_uri):
     Thing = ThingFactory(store, schema_store)
     
     blog = Thing(URI(blog_uri))
-    for item in blog.rss_items:
-        print "*", item.rss_title
-        print indent(item.rss_description)
+    for item in Thing.prefetch(blog.rss_items, ['rss_title', 'rss_description']):
+        print("*", item.rss_title)
+        print(indent(item.rss_description))
     
     
 if __name__ == '__main__':        
@@ -41,59 +41,1986 @@ SOFTWARE.
 
 __version__ = "0.1.0"
 
+import bisect
+import codecs
+import functools
+import itertools
+import json
+import math
+import mmap
+import multiprocessing
+import os
+import struct
+import tempfile
+import threading
+import time
+import weakref
+from array import array
+from collections import OrderedDict
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+from contextlib import contextmanager
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    _clock = time.perf_counter
+except AttributeError:
+    _clock = time.time
+
+try:
+    from threading import get_ident
+except ImportError:
+    from thread import get_ident
+
+# The type of text strings, which is unicode on Python 2
+_text = type(u'')
+
+# The array typecode of a 64-bit integer. Python 2 has no 'q', and its 'l'
+# is 64 bits everywhere but Windows
+try:
+    _INT64 = array('q').typecode
+except ValueError:
+    _INT64 = 'l'
+
 from rdflib.term import Identifier as ID
 from rdflib import URIRef as URI
 from rdflib import BNode, Literal, RDF, RDFS
+from rdflib import ConjunctiveGraph, Graph
+from rdflib.paths import InvPath, MulPath, SequencePath
+try:
+    from rdflib.plugins.stores.memory import Memory, SimpleMemory
+except ImportError:
+    # Before rdflib 6.0, these were IOMemory and Memory
+    from rdflib.plugins.memory import IOMemory as Memory, Memory as SimpleMemory
+try:
+    from rdflib.plugins.stores.sparqlstore import SPARQLStore
+except ImportError:
+    # Before rdflib 6.0 this needs requests; no store is then a SPARQLStore
+    SPARQLStore = ()
+from rdflib.store import Store
+from rdflib.plugins.parsers.nquads import NQuadsParser
+from rdflib.plugins.parsers.ntriples import ParseError
+try:
+    from rdflib.plugins.parsers.ntriples import W3CNTriplesParser
+except ImportError:
+    from rdflib.plugins.parsers.ntriples import NTriplesParser as W3CNTriplesParser
+
+
+RDF_SEQi = "http://www.w3.org/1999/02/22-rdf-syntax-ns#_%s"
+RDF_SEQ_PREFIX = RDF_SEQi % ""
+MAX_CARD = URI("http://www.w3.org/2002/07/owl#maxCardinality")
+CARD = URI("http://www.w3.org/2002/07/owl#cardinality")
+RESTRICTION = URI("http://www.w3.org/2002/07/owl#Restriction")
+FUNC_PROP = URI("http://www.w3.org/2002/07/owl#FunctionalProperty")
+ON_PROP = URI("http://www.w3.org/2002/07/owl#onProperty")
+ONE = Literal("1")
+
+XSD = "http://www.w3.org/2001/XMLSchema#"
+# NumPy dtypes for the XML Schema datatypes that have one
+NUMPY_DTYPES = dict(
+    [(URI(XSD + t), 'int64') for t in (
+        'integer', 'long', 'int', 'short', 'byte', 'nonPositiveInteger',
+        'nonNegativeInteger', 'positiveInteger', 'negativeInteger', 'unsignedLong',
+        'unsignedInt', 'unsignedShort', 'unsignedByte')] +
+    [(URI(XSD + t), 'float64') for t in ('decimal', 'float', 'double')] +
+    [(URI(XSD + 'boolean'), 'bool'),
+     (URI(XSD + 'dateTime'), 'datetime64[us]'),
+     (URI(XSD + 'date'), 'datetime64[D]')])
+
+# Identifies files written by SchemaIndex.save()
+SCHEMA_FORMAT = 'laconia-schema-1'
+
+# Identifies files written by write_snapshot()
+SNAPSHOT_MAGIC = b'LCNSNAP1'
+
+# CompactStore merges its delta of single writes into its sorted indexes
+# when the delta grows past 1/COMPACT_RATIO of them (or COMPACT_MIN_DELTA)
+COMPACT_RATIO = 4
+COMPACT_MIN_DELTA = 4096
+
+# How many statements copyTo() writes at a time
+COPY_BATCH_SIZE = 10000
+# prefetch(), column() and to_columns() look up each subject's values for up
+# to this many subjects in a store that indexes in memory, and scan all of the
+# predicate's statements for more (or in any other store, where each lookup
+# is a round trip). A SPARQL endpoint is asked about this many subjects per
+# query.
+SCAN_SUBJECTS = 256
+# where() intersects a condition's subjects by hash unless it matches more than
+# this many times as many subjects as the most selective condition
+WHERE_HASH_RATIO = 8
+# where() counts the subjects matching each condition this many at a time, in
+# turn, so that it stops counting the others soon after one runs out
+WHERE_COUNT_STEP = 64
+
+# How many results a threadsafe factory reads from the store at a time
+LOCKED_READ_CHUNK = 256
+
+# The most attribute values a ThingFactory's read cache holds before it is
+# emptied
+READ_CACHE_SIZE = 10000
+# The most attribute names (and, separately, URIs) a ThingFactory remembers
+# the resolution of before forgetting them all
+NAME_CACHE_SIZE = 4096
+
+# Stands for an attribute with no value in the read cache
+_MISSING = object()
+
+# Predicates whose statements feed into a SchemaIndex
+SCHEMA_PREDICATES = frozenset([RDFS.range, RDFS.domain, RDFS.subClassOf, ON_PROP, MAX_CARD, CARD])
+# Classes whose rdf:type statements feed into a SchemaIndex
+SCHEMA_CLASSES = frozenset([FUNC_PROP, RESTRICTION])
+
+
+def _add_triples(store, triples):
+    """
+    Add statements to a store, with a single addN call where the store is a
+    plain Graph.
+
+    store - rdflib.Graph.Graph instance
+    triples - iterable of (s, p, o) tuples
+    """
+    if isinstance(store, Graph) and not isinstance(store, ConjunctiveGraph):
+        store.addN((s, p, o, store) for (s, p, o) in triples)
+    else:
+        for triple in triples:
+            store.add(triple)
+
+
+def _indexed_in_memory(store):
+    """
+    Figure out if an rdflib store answers lookups from indexes in this
+    process, so that a lookup per subject costs less than scanning a whole
+    predicate, rather than with a round trip to a database or server each.
+    """
+    if isinstance(store, TrackedStore):
+        store = store.store
+    return isinstance(store, (Memory, SimpleMemory, CompactStore, SnapshotStore))
+
+
+def _matches_lang(o, lang):
+    """
+    Given an RDF term and a language (or None), figure out if the term should
+    be shown to someone asking for that language.
+    """
+    return not lang or not isinstance(o, Literal) or o.language == lang or not o.language or o.language.startswith(lang)
+
+
+def _node_id(node):
+    """
+    Return the JSON-LD @id of a node: its URI, or _:id for a blank node.
+    """
+    return '_:' + node if isinstance(node, BNode) else _text(node)
+
+
+# Datatypes whose literals are written as native JSON values in JSON-LD
+JSON_NATIVE = {
+    URI(XSD + 'integer'): int,
+    URI(XSD + 'double'): float,
+    URI(XSD + 'boolean'): bool,
+}
+
+
+def _touches_schema(pred, obj):
+    """
+    Given the predicate and object of a statement (or pattern), figure out
+    if adding or removing it could change a SchemaIndex.
+    """
+    return pred is None or pred in SCHEMA_PREDICATES or \
+        (pred == RDF.type and (obj is None or obj in SCHEMA_CLASSES))
+
+
+def _tracker(graph):
+    """
+    Return the TrackedStore behind a graph, which counts the writes made to
+    it, or None if the graph's store is not one.
+
+    graph - rdflib.Graph.Graph instance
+
+    returns TrackedStore instance or None
+    """
+    store = graph.store
+    return store if isinstance(store, TrackedStore) else None
+
+
+def _numpy():
+    """
+    Return the numpy module, which is optional except for array extraction.
+    """
+    if numpy is None:
+        raise ImportError('NumPy is needed to extract arrays of values')
+    return numpy
+
+
+def _to_array(literals, dtype):
+    """
+    Decode the lexical forms of some literals into a NumPy masked array,
+    converting them all in one go where possible. Missing values (None),
+    nodes that aren't literals and literals that can't be read as dtype are
+    masked.
+
+    literals - list of rdflib.Literal.Literal instances, other terms or None
+    dtype - NumPy dtype, or None to use the datatype of the first literal
+
+    returns numpy.ma.MaskedArray instance
+    """
+    numpy = _numpy()
+    present = [isinstance(lit, Literal) for lit in literals]
+    if dtype is None:
+        datatypes = [lit.datatype for (lit, ok) in zip(literals, present) if ok]
+        dtype = NUMPY_DTYPES.get(datatypes[0], object) if datatypes else object
+    dtype = numpy.dtype(dtype)
+    lexicals = [str(lit) if ok else '' for (lit, ok) in zip(literals, present)]
+    mask = numpy.logical_not(numpy.array(present, dtype=bool))
+
+    if dtype == object:
+        values = numpy.empty(len(literals), dtype=object)
+        values[:] = [lit.toPython() if ok else None for (lit, ok) in zip(literals, present)]
+    elif dtype.kind == 'b':
+        strings = numpy.array(lexicals, dtype=str)
+        values = (strings == 'true') | (strings == '1')
+        mask |= ~(values | (strings == 'false') | (strings == '0'))
+    elif dtype.kind == 'M':
+        values = numpy.zeros(len(literals), dtype=dtype)
+        for i, (lit, ok) in enumerate(zip(literals, present)):
+            value = lit.toPython() if ok else None
+            if getattr(value, 'tzinfo', None) is not None:
+                value = (value - value.utcoffset()).replace(tzinfo=None)
+            try:
+                values[i] = value
+            except (ValueError, TypeError):
+                mask[i] = True
+    else:
+        strings = numpy.array([lex if ok else '0' for (lex, ok) in zip(lexicals, present)], dtype=str)
+        try:
+            values = strings.astype(dtype)
+        except (ValueError, TypeError, OverflowError):
+            values = numpy.zeros(len(literals), dtype=dtype)
+            for i, lexical in enumerate(strings):
+                try:
+                    values[i] = numpy.array(lexical).astype(dtype)
+                except (ValueError, TypeError, OverflowError):
+                    mask[i] = True
+    return numpy.ma.MaskedArray(values, mask=mask)
+
+
+def _pattern(s=None, p=None, o=None):
+    """
+    Name a triple pattern by which positions are bound, e.g. 'SP?'.
+    """
+    return ('S' if s is not None else '?') + ('P' if p is not None else '?') + \
+        ('O' if o is not None else '?')
+
+
+class FactoryStats(object):
+    """
+    Counters and timings gathered by a ThingFactory with stats enabled: store
+    calls by triple pattern, writes, cardinality checks, cache hits and
+    misses, and the time spent in the main Thing conversion methods (which
+    includes time spent in any of them they call).
+
+    Hooks are called as hook(kind, name, value) for each event, where kind is
+    one of the keys of snapshot() and value is a count or a time in seconds.
+    """
+    def __init__(self):
+        self.hooks = []
+        self.reset()
+
+    def reset(self):
+        self._counts = {}
+        self._timings = {}
+
+    def count(self, kind, name, n=1):
+        counts = self._counts.setdefault(kind, {})
+        counts[name] = counts.get(name, 0) + n
+        for hook in self.hooks:
+            hook(kind, name, n)
+
+    def time(self, name, seconds):
+        timing = self._timings.get(name)
+        if timing is None:
+            timing = self._timings[name] = [0, 0.0]
+        timing[0] += 1
+        timing[1] += seconds
+        for hook in self.hooks:
+            hook('timings', name, seconds)
+
+    def snapshot(self):
+        """
+        returns dict of kind ('store_calls', 'store_writes',
+        'cardinality_checks', 'cache_hits', 'cache_misses' or 'timings') to
+        dict of name to count, or for timings to dict with 'calls' and
+        'seconds'
+        """
+        data = dict((kind, {}) for kind in ('store_calls', 'store_writes', 'cardinality_checks',
+                                            'cache_hits', 'cache_misses'))
+        for (kind, counts) in self._counts.items():
+            data[kind] = dict(counts)
+        data['timings'] = dict((name, {'calls': calls, 'seconds': seconds})
+                               for (name, (calls, seconds)) in self._timings.items())
+        return data
+
+
+class _CountingView(object):
+    """
+    Wraps the store or _Batch a ThingFactory reads from, counting each call
+    by its triple pattern.
+    """
+    def __init__(self, view, stats):
+        self._view = view
+        self._stats = stats
+
+    def __getattr__(self, attr):
+        return getattr(self._view, attr)
+
+    def triples(self, pattern):
+        self._stats.count('store_calls', _pattern(*pattern))
+        return self._view.triples(pattern)
+
+    def objects(self, subject=None, predicate=None):
+        self._stats.count('store_calls', _pattern(subject, predicate))
+        return self._view.objects(subject, predicate)
+
+    def subjects(self, predicate=None, object=None):
+        self._stats.count('store_calls', _pattern(None, predicate, object))
+        return self._view.subjects(predicate, object)
+
+    def predicate_objects(self, subject=None):
+        self._stats.count('store_calls', _pattern(subject))
+        return self._view.predicate_objects(subject)
+
+    def subject_objects(self, predicate=None):
+        self._stats.count('store_calls', _pattern(None, predicate))
+        return self._view.subject_objects(predicate)
+
+    def __contains__(self, triple):
+        self._stats.count('store_calls', _pattern(*triple))
+        return triple in self._view
+
+    def __iter__(self):
+        self._stats.count('store_calls', '???')
+        return iter(self._view)
+
+    def __len__(self):
+        return len(self._view)
+
+
+def _timed(method):
+    """
+    Wrap a Thing method to record the time spent in it when its factory has
+    stats enabled. Otherwise the only cost is checking that it hasn't.
+    """
+    name = method.__name__
+
+    @functools.wraps(method)
+    def timed(self, *args, **kwargs):
+        stats = self._factory.stats
+        if stats is None:
+            return method(self, *args, **kwargs)
+        start = _clock()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            stats.time(name, _clock() - start)
+    return timed
+
+
+class _ReadWriteLock(object):
+    """
+    A lock that many threads can hold for reading at once, or one thread for
+    writing. Both are reentrant, and the writer may also read. Waiting
+    writers hold off new readers, so that writes are not starved.
+    """
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = {}
+        self._writer = None
+        self._writes = 0
+        self._waiting = 0
+        # Reads part way through their results, which a writer must finish
+        # before it writes
+        self._pending = set()
+
+    def acquire_read(self):
+        me = get_ident()
+        with self._cond:
+            if self._writer != me and me not in self._readers:
+                while self._writer is not None or self._waiting:
+                    self._cond.wait()
+            self._readers[me] = self._readers.get(me, 0) + 1
+
+    def release_read(self):
+        me = get_ident()
+        with self._cond:
+            if self._readers[me] == 1:
+                del self._readers[me]
+                if not self._readers:
+                    self._cond.notify_all()
+            else:
+                self._readers[me] -= 1
+
+    def acquire_write(self):
+        me = get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._writes += 1
+                return
+            self._waiting += 1
+            try:
+                while self._writer is not None or any(t != me for t in self._readers):
+                    self._cond.wait()
+            finally:
+                self._waiting -= 1
+            self._writer, self._writes = me, 1
+        try:
+            self._finish_pending()
+        except BaseException:
+            self.release_write()
+            raise
+
+    def _finish_pending(self):
+        # Reading the rest of a result may read through another _LockedView,
+        # which may leave a read of its own pending, so go until none are
+        while True:
+            with self._cond:
+                if not self._pending:
+                    return
+                read = self._pending.pop()
+            read.results = iter(list(read.results))
+
+    def pend(self, read):
+        """
+        Note a _PendingRead whose results the next writer must read to the
+        end before it writes.
+        """
+        with self._cond:
+            self._pending.add(read)
+
+    def unpend(self, read):
+        with self._cond:
+            self._pending.discard(read)
+
+    def release_write(self):
+        with self._cond:
+            self._writes -= 1
+            if not self._writes:
+                self._writer = None
+                self._cond.notify_all()
+
+    @contextmanager
+    def reading(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def writing(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class _PendingRead(object):
+    """
+    The results of a read that a _LockedView gives a chunk at a time.
+    """
+    __slots__ = ('results',)
+
+    def __init__(self):
+        self.results = None
+
+
+class _LockedView(object):
+    """
+    Wraps a store so that reads hold a _ReadWriteLock for reading. Results
+    are read LOCKED_READ_CHUNK at a time, each chunk under the lock, so that
+    they are safe to iterate while other threads write, and a reader that
+    stops early reads little more than it used. A writer first reads the
+    rest of the results of any read part way through, so each result is
+    given once and read once, and a read holds on to no more than a chunk
+    unless a write comes while it is part way through.
+    """
+    def __init__(self, view, lock, local=None):
+        """
+        view - rdflib.Graph.Graph instance
+        lock - _ReadWriteLock instance
+        local - threading.local instance; reads go to its batch instead of
+                view, if it has one
+        """
+        self._view = view
+        self._lock = lock
+        self._local = local
+
+    def __getattr__(self, attr):
+        return getattr(self._view, attr)
+
+    def _target(self):
+        batch = getattr(self._local, 'batch', None) if self._local is not None else None
+        return batch if batch is not None else self._view
+
+    def _chunks(self, method, *args):
+        lock, read = self._lock, _PendingRead()
+        try:
+            while True:
+                lock.acquire_read()
+                try:
+                    if read.results is None:
+                        read.results = getattr(self._target(), method)(*args)
+                        lock.pend(read)
+                    chunk = list(itertools.islice(read.results, LOCKED_READ_CHUNK))
+                finally:
+                    lock.release_read()
+                for result in chunk:
+                    yield result
+                if len(chunk) < LOCKED_READ_CHUNK:
+                    return
+        finally:
+            lock.unpend(read)
+
+    def triples(self, pattern):
+        return self._chunks('triples', pattern)
+
+    def objects(self, subject=None, predicate=None):
+        return self._chunks('objects', subject, predicate)
+
+    def subjects(self, predicate=None, object=None):
+        return self._chunks('subjects', predicate, object)
+
+    def predicate_objects(self, subject=None):
+        return self._chunks('predicate_objects', subject)
+
+    def subject_objects(self, predicate=None):
+        return self._chunks('subject_objects', predicate)
+
+    def __contains__(self, triple):
+        self._lock.acquire_read()
+        try:
+            return triple in self._target()
+        finally:
+            self._lock.release_read()
+
+    def __iter__(self):
+        return self._chunks('__iter__')
+
+    def __len__(self):
+        self._lock.acquire_read()
+        try:
+            return len(self._target())
+        finally:
+            self._lock.release_read()
+
+
+class _Batch(object):
+    """
+    A unit of work over a store: buffers statements added and removed, and
+    answers reads as if they had already been applied.
+    """
+    def __init__(self, store, view=None):
+        """
+        store - rdflib.Graph.Graph instance
+        view - where to read the store's statements from; defaults to store
+        """
+        self.store = store
+        self._view = view if view is not None else store
+        self.schema_version = 0
+        self._added = Graph()
+        self._removed = set()
+
+    def add(self, triple):
+        if triple in self._removed:
+            self._removed.discard(triple)
+        else:
+            self._added.add(triple)
+        if _touches_schema(triple[1], triple[2]):
+            self.schema_version += 1
+
+    def addN(self, triples):
+        for triple in triples:
+            self.add(triple)
+
+    def remove(self, pattern):
+        self._added.remove(pattern)
+        self._removed.update(self._view.triples(pattern))
+        if _touches_schema(pattern[1], pattern[2]):
+            self.schema_version += 1
+
+    def flush(self):
+        """
+        Apply the buffered writes to the store: all removals, then all
+        additions in one batch.
+
+        returns (removed, added) tuple of how many statements were written
+        """
+        removed, added = len(self._removed), len(self._added)
+        for triple in self._removed:
+            self.store.remove(triple)
+        if added:
+            _add_triples(self.store, self._added)
+        self._added, self._removed = Graph(), set()
+        return removed, added
+
+    def triples(self, pattern):
+        found = set()
+        for triple in self._view.triples(pattern):
+            if triple not in self._removed:
+                found.add(triple)
+                yield triple
+        for triple in self._added.triples(pattern):
+            if triple not in found:
+                yield triple
+
+    def __contains__(self, triple):
+        for _ in self.triples(triple):
+            return True
+        return False
+
+    def __len__(self):
+        return len(self._view) - len(self._removed) + \
+            sum(1 for triple in self._added if triple not in self._view)
+
+    def subjects(self, predicate=None, object=None):
+        for (s, _, _) in self.triples((None, predicate, object)):
+            yield s
+
+    def objects(self, subject=None, predicate=None):
+        for (_, _, o) in self.triples((subject, predicate, None)):
+            yield o
+
+    def subject_objects(self, predicate=None):
+        for (s, _, o) in self.triples((None, predicate, None)):
+            yield s, o
+
+    def predicate_objects(self, subject=None):
+        for (_, p, o) in self.triples((subject, None, None)):
+            yield p, o
+
+
+def _encode_term(term):
+    """
+    Given an RDF term, return a tuple of plain strings that _decode_term turns
+    back into an equal term.
+    """
+    if isinstance(term, Literal):
+        return ('l', _text(term), term.language or '', _text(term.datatype or ''))
+    elif isinstance(term, BNode):
+        return ('b', _text(term))
+    else:
+        return ('u', _text(term))
+
+
+def _decode_term(encoded):
+    """
+    Given a tuple from _encode_term, return the RDF term.
+    """
+    kind, value = encoded[0], encoded[1]
+    if kind == 'u':
+        return URI(value)
+    elif kind == 'b':
+        return BNode(value)
+    else:
+        return Literal(value, lang=encoded[2] or None, datatype=encoded[3] or None)
+
+
+def _bind(store, prefix, namespace):
+    """
+    Bind a prefix on a store, replacing any existing binding of that prefix
+    where the version of rdflib allows.
+    """
+    try:
+        store.bind(prefix, namespace, replace=True)
+    except TypeError:
+        store.bind(prefix, namespace)
+
+
+class SchemaIndex(object):
+    """
+    The facts from a schema store that Laconia consults on every attribute
+    access, compiled into dicts so that cardinality and datatype decisions
+    don't have to query the store.
+    """
+    def __init__(self, functional=None, restrictions=None, ranges=None, domains=None,
+                 namespaces=None, aliases=None):
+        """
+        functional - set of predicates that are owl:FunctionalProperty
+        restrictions - dict mapping a predicate to the set of classes that
+                       restrict it to a cardinality of one
+        ranges - dict mapping a predicate to a list of its rdfs:range values
+        domains - dict mapping a predicate to a list of its rdfs:domain values
+        namespaces - dict mapping prefixes to namespace URIs, to be bound on
+                     the store of a ThingFactory given this index
+        aliases - dict of aliases, to be added to a ThingFactory given this index
+        """
+        self.functional = functional or set()
+        self.restrictions = restrictions or {}
+        self.ranges = ranges or {}
+        self.domains = domains or {}
+        self.namespaces = namespaces or {}
+        self.aliases = aliases or {}
+
+    def save(self, path):
+        """
+        Write this index to a JSON file, which SchemaIndex.load() (or
+        ThingFactory's schema argument) reads back without parsing the schema.
+
+        path - str filename
+        """
+        e = _encode_term
+        data = {
+            'format': SCHEMA_FORMAT,
+            'functional': [e(p) for p in self.functional],
+            'restrictions': [(e(p), [e(c) for c in classes])
+                             for (p, classes) in self.restrictions.items()],
+            'ranges': [(e(p), [e(t) for t in types]) for (p, types) in self.ranges.items()],
+            'domains': [(e(p), [e(t) for t in types]) for (p, types) in self.domains.items()],
+            'namespaces': [(_text(prefix), _text(ns)) for (prefix, ns) in self.namespaces.items()],
+            'aliases': [(_text(alias), _text(uri)) for (alias, uri) in self.aliases.items()],
+        }
+        with open(path, 'w') as f:
+            json.dump(data, f)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read an index written by save().
+
+        path - str filename
+
+        returns SchemaIndex instance
+        """
+        with open(path) as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or data.get('format') != SCHEMA_FORMAT:
+            raise ValueError('Not a compiled Laconia schema: %s' % path)
+        d = _decode_term
+        return cls(
+            set(d(p) for p in data['functional']),
+            dict((d(p), set(d(c) for c in classes)) for (p, classes) in data['restrictions']),
+            dict((d(p), [d(t) for t in types]) for (p, types) in data['ranges']),
+            dict((d(p), [d(t) for t in types]) for (p, types) in data['domains']),
+            dict((prefix, URI(ns)) for (prefix, ns) in data['namespaces']),
+            dict(data['aliases']))
+
+    @classmethod
+    def compile(cls, schema_store):
+        """
+        Build an index from the statements in a schema store.
+
+        schema_store - rdflib.Graph.Graph instance
+
+        returns SchemaIndex instance
+        """
+        functional = set(schema_store.subjects(RDF.type, FUNC_PROP))
+
+        # cls rdfs:subClassOf [ a owl:Restriction; owl:onProperty pred; owl:maxCardinality "1" ]
+        # cls rdfs:subClassOf [ a owl:Restriction; owl:onProperty pred; owl:cardinality "1" ]
+        restrictions = {}
+        for restriction in schema_store.subjects(RDF.type, RESTRICTION):
+            if (restriction, MAX_CARD, ONE) not in schema_store and \
+               (restriction, CARD, ONE) not in schema_store:
+                continue
+            classes = set(schema_store.subjects(RDFS.subClassOf, restriction))
+            if not classes:
+                continue
+            for pred in schema_store.objects(restriction, ON_PROP):
+                restrictions.setdefault(pred, set()).update(classes)
+
+        ranges, domains = {}, {}
+        for (pred, obj_type) in schema_store.subject_objects(RDFS.range):
+            ranges.setdefault(pred, []).append(obj_type)
+        for (pred, obj_type) in schema_store.subject_objects(RDFS.domain):
+            domains.setdefault(pred, []).append(obj_type)
+
+        return cls(functional, restrictions, ranges, domains)
+
+
+def _restricting_classes(schema_store, pred):
+    """
+    Return the set of classes that restrict a predicate to a cardinality of
+    one, as in SchemaIndex.restrictions.
+    """
+    classes = set()
+    for restriction in schema_store.subjects(ON_PROP, pred):
+        if (restriction, RDF.type, RESTRICTION) in schema_store and \
+           ((restriction, MAX_CARD, ONE) in schema_store or
+                (restriction, CARD, ONE) in schema_store):
+            classes.update(schema_store.subjects(RDFS.subClassOf, restriction))
+    return classes
+
+
+class _LiveTable(object):
+    """
+    One of the tables of a _LiveSchema: looks like a dict from predicate to
+    value, but looks each predicate up in the schema store when asked.
+    """
+    def __init__(self, view, lookup):
+        """
+        view - callable returning what to read the schema from
+        lookup - callable(schema_store, pred) returning the value for pred,
+                 or a false value if it has none
+        """
+        self._view = view
+        self._lookup = lookup
+
+    def get(self, pred, default=None):
+        return self._lookup(self._view(), pred) or default
+
+    def __getitem__(self, pred):
+        value = self.get(pred)
+        if value is None:
+            raise KeyError(pred)
+        return value
+
+    def __contains__(self, pred):
+        return bool(self._lookup(self._view(), pred))
+
+
+class _LiveSchema(object):
+    """
+    Answers what a SchemaIndex does by querying the schema store each time,
+    for a ThingFactory that can't tell when its schema store changes.
+    """
+    def __init__(self, view):
+        """
+        view - callable returning what to read the schema from
+        """
+        self.functional = _LiveTable(view, lambda store, pred: (pred, RDF.type, FUNC_PROP) in store)
+        self.restrictions = _LiveTable(view, _restricting_classes)
+        self.ranges = _LiveTable(view, lambda store, pred: list(store.objects(pred, RDFS.range)))
+        self.domains = _LiveTable(view, lambda store, pred: list(store.objects(pred, RDFS.domain)))
+
+
+class _BNodeLabels(object):
+    """
+    Stands in for the map an N-Triples parser keeps from the blank node
+    labels in a document to BNodes, which would hold every label in the
+    document. Each label is named afresh from the document and the label
+    instead.
+    """
+    def __init__(self):
+        self._document = str(BNode())
+
+    def get(self, label, default=None):
+        return '%s%s' % (self._document, label)
+
+
+class _StatementSink(object):
+    """
+    Takes the statements from rdflib's N-Triples parser (as triple()) or
+    N-Quads parser (as add() on the graph it names, which is ignored) one at
+    a time.
+    """
+    # The graph name the N-Quads parser gives statements in the default graph
+    identifier = None
+
+    def __init__(self):
+        self.statement = None
+
+    def triple(self, s, p, o):
+        self.statement = (s, p, o)
+
+    def add(self, triple):
+        self.statement = triple
+
+    def get_context(self, identifier):
+        return self
+
+    @property
+    def default_context(self):
+        return self
+
+
+def _read_statements(f, quads=False):
+    """
+    Read N-Triples, or N-Quads ignoring the graph names, one statement at a
+    time rather than into a graph.
+
+    f - file object, binary or text
+    quads - if True, read N-Quads
+
+    returns iterator yielding (s, p, o) tuples
+    """
+    sink = _StatementSink()
+    parser_class = NQuadsParser if quads else W3CNTriplesParser
+    try:
+        parser = parser_class(sink, bnode_context=_BNodeLabels())
+    except TypeError:
+        # Before rdflib 6.0, the parser keeps the labels in _bnode_ids
+        parser = parser_class(sink)
+        parser._bnode_ids = _BNodeLabels()
+    if isinstance(f.read(0), bytes):
+        f = codecs.getreader('utf-8')(f)
+    parser.file, parser.buffer = f, ''
+    while True:
+        parser.line = line = parser.readline()
+        if line is None:
+            return
+        try:
+            parser.parseline()
+        except ParseError:
+            raise ParseError('Invalid line: %s' % line)
+        if sink.statement is not None:
+            yield sink.statement
+            sink.statement = None
+
+
+class ThingFactory(object):
+    """
+    Fed a store, return a factory that can be used to instantiate
+    Things into that world.
+    """
+    def __init__(self, store, schema_store=None, alias_map=None, intern=False,
+                 copy_options=None, schema=None, stats=False, threadsafe=False, cache=False,
+                 compile_schema=False):
+        """
+        store - rdflib.Graph.Graph instance
+        schema_store - rdflib.Graph.Graph instance; defaults to store
+        alias_map - dict of aliases, as added by addAlias()
+        intern - if True, the same node always yields the same Thing while that
+                 Thing is alive, until it is given a lang or prefetched
+                 values; after that the node yields a new Thing, so that one
+                 holder's lang or prefetched values are not another's.
+        copy_options - dict of keyword arguments to copyTo(), used when a Thing
+                       from another store is linked to a Thing from this one
+        schema - a SchemaIndex, or the filename of one written by save_schema(),
+                 to use instead of compiling schema_store. Its prefixes are
+                 bound on store, except where store already binds the prefix
+                 or the namespace, and its aliases added to alias_map.
+        compile_schema - if True, compile schema_store into a SchemaIndex, as
+                         is always done if it is backed by a TrackedStore,
+                         rather than query it on each attribute access. Call
+                         invalidate_schema() after changing it other than
+                         through this factory.
+        stats - if True, gather FactoryStats in self.stats; see enable_stats()
+        threadsafe - if True, the factory and its Things may be shared between
+                     threads: reads of store take a shared lock for each chunk
+                     of results, writes (including the remove and add of
+                     replacing a value) take an exclusive one, first reading
+                     the rest of any read part way through, and batch()
+                     batches each thread's writes separately. All writes to
+                     store should then go through the factory.
+        cache - if True, remember the values read from Things' attributes,
+                keyed by subject, predicate and lang, until anything is
+                written through this factory or, if the rdflib store behind
+                store (or schema_store) is a TrackedStore, through any Graph
+                over it. Call invalidate_cache() after writing to the store
+                some other way.
+        """
+        self.store = store
+        self.schema_store = schema_store or self.store
+        self.alias_map = alias_map or {}
+        self.copy_options = copy_options or {}
+        self._things = weakref.WeakValueDictionary() if intern else None
+        self._batch = None
+        self._lock = _ReadWriteLock() if threadsafe else None
+        # Each thread's batch, if threadsafe
+        self._local = threading.local() if threadsafe else None
+        self._things_lock = threading.Lock() if threadsafe else None
+        self.stats = None
+        # Where Things read from: the store, or the active _Batch
+        self._view = self._reader()
+        if stats:
+            self.enable_stats()
+        # The compiled SchemaIndex and the version it was compiled from, as
+        # one tuple so that threads never see one without the other
+        self._schema = None
+        # Counts of writes made to the stores, by any Graph, if they are
+        # TrackedStores; the store's only matter to the read cache
+        self._schema_tracker = _tracker(self.schema_store)
+        self._tracker = _tracker(self.store) if cache else None
+        # Writes made through this factory that could change the schema
+        self._schema_writes = 0
+        # Unless changes to the schema store can be seen, or the caller will
+        # say when it changes, the schema is read from it on each use
+        self._live_schema = None
+        if not compile_schema and self._schema_tracker is None:
+            self._live_schema = _LiveSchema(self._schema_view)
+        # Attribute name to (URI or None, prefix, namespace it was bound to).
+        # This and _names are never iterated, and are replaced rather than
+        # cleared, so that threads can share them without a lock
+        self._uris = {}
+        # Writes made through this factory, for read caching
+        self._writes = 0
+        self._cache = {} if cache else None
+        self._cache_version = None
+        # The reverse of _uris: URI to (attribute name, compact IRI), and the
+        # prefix bindings they were worked out from
+        self._names = {}
+        self._names_bindings = None
+
+        if schema is not None and not isinstance(schema, SchemaIndex):
+            schema = SchemaIndex.load(schema)
+        self._fixed_schema = schema
+        if schema is not None:
+            # Prefixes the store already has, either way round, are left as
+            # they are
+            bound = self.store.namespace_manager.store
+            for (prefix, namespace) in schema.namespaces.items():
+                if bound.namespace(prefix) is None and bound.prefix(namespace) is None:
+                    self.store.bind(prefix, namespace)
+            for (alias, uri) in schema.aliases.items():
+                self.alias_map.setdefault(alias, uri)
+
+    def __call__(self, ident=None, **props):
+        """
+        ident - either:
+            a) None  (creates a new BNode)
+            b) rdflib.URIRef.URIRef instance
+            c) str in the form prefix_localname
+        props - dict of properties and values, to be added. If the value is a list, its
+                contents will be added to a ResourceSet.
+
+        returns Thing instance
+        """
+        if self._things is None:
+            return Thing(self.store, self.schema_store, self.alias_map, ident, props, factory=self)
+        thing = self._thing(Thing, ident)
+        thing._add_props(props)
+        return thing
+
+    def create_many(self, records):
+        """
+        Create many Things at once, e.g. when loading rows from a CSV or JSON
+        export. Each distinct attribute name is resolved, and its cardinality
+        looked up, once for the whole call, and all the resulting statements
+        are written in one batch.
+
+        records - iterable whose items are either:
+            a) a dict of properties and values, as for __call__ (creates a new BNode)
+            b) an (ident, props) pair, with ident and props as for __call__
+          A property whose cardinality is greater than one takes a list or set of values.
+
+        returns iterator yielding a Thing instance for each record, made on demand
+        """
+        schema = self.schema
+        converter = self._converter()
+        preds, facts, idents = {}, {}, []
+        with self.batch():
+            for record in records:
+                if isinstance(record, dict):
+                    ident, props, existing = BNode(), record, False
+                else:
+                    ident, props = record
+                    existing = ident is not None
+                    ident = self._node(ident)
+                idents.append(ident)
+
+                subj_types = None
+                for attr, obj in props.items():
+                    pred = self._record_pred(attr, preds)
+                    try:
+                        unique, classes = facts[pred]
+                    except KeyError:
+                        # A live schema queries the store, so ask it once per property
+                        unique, classes = facts[pred] = (pred in schema.functional,
+                                                         schema.restrictions.get(pred))
+                    if not unique and classes:
+                        if subj_types is None:
+                            subj_types = self._record_types(ident, props, existing, preds)
+                        unique = not classes.isdisjoint(subj_types)
+
+                    if unique:
+                        if existing:
+                            self._remove((ident, pred, None))
+                        self._add((ident, pred, converter._python_to_rdf(pred, obj)))
+                    elif isinstance(obj, (list, set, frozenset, ResourceSet)):
+                        self._add_all([(ident, pred, converter._python_to_rdf(pred, o))
+                                       for o in obj])
+                    else:
+                        raise TypeError
+        return (self._thing(Thing, ident) for ident in idents)
+
+    def where(self, limit=None, offset=0, **conditions):
+        """
+        Find the Things that have all of the given property values.
+
+        E.g.,
+          .where(rdf_type=Thing("foaf_Person"), foaf_gender="male")
+
+        The condition that matches fewest subjects drives the search; the
+        others are checked against it by hash lookup, or by asking the store
+        about each candidate when they match many more subjects.
+
+        limit - the most Things to yield; None for no limit
+        offset - how many matching Things to skip first
+        conditions - attribute names (in the form prefix_localname) mapped to
+                     values (python literal datatypes or Things), converted
+                     the same way as for ResourceSet membership tests
+
+        returns iterator yielding Thing instances
+        """
+        if not conditions:
+            raise TypeError('where() needs at least one condition')
+        converter = self._converter()
+        patterns = []
+        for attr, obj in conditions.items():
+            pred = self._attr_to_uri(attr)
+            patterns.append((pred, converter._python_to_term(pred, obj)))
+
+        # Count the subjects matching each pattern in turn, a step at a time,
+        # giving up on any that are clearly less selective than the first to
+        # run out
+        view, counted, fewest = self._view, [], None
+        counting = [(pred, obj, view.subjects(pred, obj), [0]) for (pred, obj) in patterns]
+        while counting:
+            for entry in list(counting):
+                pred, obj, subjects, count = entry
+                taken = sum(1 for _ in itertools.islice(subjects, WHERE_COUNT_STEP))
+                count[0] += taken
+                if taken < WHERE_COUNT_STEP:
+                    fewest = count[0] if fewest is None else min(fewest, count[0])
+                elif fewest is None or count[0] <= fewest * WHERE_HASH_RATIO:
+                    continue
+                counting.remove(entry)
+                counted.append((count[0], pred, obj))
+        counted.sort(key=lambda c: c[0])
+
+        checks = []
+        for (count, pred, obj) in counted[1:]:
+            if count <= fewest * WHERE_HASH_RATIO:
+                checks.append(set(view.subjects(pred, obj)).__contains__)
+            else:
+                checks.append(lambda subj, pred=pred, obj=obj: (subj, pred, obj) in view)
+
+        _, pred, obj = counted[0]
+        matches = (subj for subj in view.subjects(pred, obj)
+                   if all(check(subj) for check in checks))
+        stop = None if limit is None else offset + limit
+        return (self._thing(Thing, subj) for subj in itertools.islice(matches, offset, stop))
+
+    def _converter(self):
+        """
+        Return a Thing to convert values with. Conversion doesn't depend on the
+        subject, so one Thing can convert values for any of them.
+        """
+        return Thing(self.store, self.schema_store, self.alias_map, RDF.nil, factory=self)
+
+    def _record_pred(self, attr, preds):
+        """
+        Resolve an attribute name of a record, looking it up in preds, the
+        dict of names already resolved in this call, or else adding it there.
+        """
+        try:
+            return preds[attr]
+        except KeyError:
+            pred = preds[attr] = attr if isinstance(attr, ID) else self._attr_to_uri(attr)
+            return pred
+
+    def _record_types(self, ident, props, existing, preds):
+        """
+        The rdf:types a record will give its subject, plus any it already has.
+        preds is as for _record_pred().
+        """
+        types = set()
+        for attr, obj in props.items():
+            if self._record_pred(attr, preds) == RDF.type:
+                for o in (obj if isinstance(obj, (list, set, frozenset)) else [obj]):
+                    types.add(o._id if isinstance(o, Thing) else o)
+        if existing:
+            types.update(self._view.objects(ident, RDF.type))
+        return types
+
+    def _node(self, ident):
+        """
+        ident - as for __call__
+
+        returns rdflib.Identifier instance
+        """
+        if ident is None:
+            return BNode()
+        elif isinstance(ident, ID):
+            return ident
+        else:
+            return self._attr_to_uri(ident)
+
+    def _thing(self, cls, ident):
+        """
+        Return a Thing for a node, reusing the live one if Things are interned.
+
+        cls - Thing or a subclass of it
+        ident - as for __call__
+
+        returns cls instance
+        """
+        if self._things is None:
+            return cls(self.store, self.schema_store, self.alias_map, ident, factory=self)
+        ident = self._node(ident)
+        key = (cls, ident)
+        if self._things_lock is not None:
+            with self._things_lock:
+                return self._interned(cls, ident, key)
+        return self._interned(cls, ident, key)
+
+    def _interned(self, cls, ident, key):
+        thing = self._things.get(key)
+        if self.stats is not None:
+            self.stats.count('cache_misses' if thing is None else 'cache_hits', 'things')
+        if thing is None:
+            thing = self._things[key] = cls(self.store, self.schema_store, self.alias_map,
+                                            ident, factory=self)
+        return thing
+
+    def _detach(self, thing):
+        """
+        Stop giving out an interned Thing for its node, now that it holds
+        state of its own (a lang or prefetched values).
+        """
+        if self._things is None:
+            return
+        key = (thing.__class__, thing._id)
+        if self._things_lock is not None:
+            with self._things_lock:
+                if self._things.get(key) is thing:
+                    del self._things[key]
+        elif self._things.get(key) is thing:
+            del self._things[key]
+
+    @property
+    def schema(self):
+        """
+        The schema facts that Things consult, as a SchemaIndex or an object
+        that answers the same questions. If the factory was given a compiled
+        schema, that is used. If it was made with compile_schema=True, or the
+        schema store is backed by a TrackedStore, it is the SchemaIndex
+        compiled from schema_store, shared by all Things from this factory
+        and recompiled when statements that affect it are written through
+        this factory, or through any Graph over that TrackedStore, or after
+        invalidate_schema(). Otherwise the schema store is queried on each
+        use, so that changes to it are seen straight away.
+        """
+        if self._fixed_schema is not None:
+            return self._fixed_schema
+        if self._live_schema is not None:
+            return self._live_schema
+        tracker = self._schema_tracker
+        version = (tracker.schema_version if tracker is not None else None, self._schema_writes)
+        schema_store = self.schema_store
+        batch = self._batch if self._local is None else getattr(self._local, 'batch', None)
+        if batch is not None and batch.schema_version and schema_store is self.store:
+            version, schema_store = (version, batch.schema_version), batch
+        compiled = self._schema
+        stale = compiled is None or version != compiled[1]
+        if self.stats is not None:
+            self.stats.count('cache_misses' if stale else 'cache_hits', 'schema')
+        if stale:
+            if self._lock is None:
+                compiled = (SchemaIndex.compile(schema_store), version)
+            else:
+                with self._lock.reading():
+                    compiled = (SchemaIndex.compile(schema_store), version)
+            self._schema = compiled
+        return compiled[0]
+
+    def _schema_view(self):
+        """
+        Return what a schema that is queried on each use reads from: the same
+        view Things read from if schema_store is the store, or else
+        schema_store, under the lock if threadsafe.
+        """
+        if self.schema_store is self.store:
+            return self._view
+        if self._lock is None:
+            return self._wrap(self.schema_store)
+        return self._wrap(_LockedView(self.schema_store, self._lock))
+
+    def save_schema(self, path):
+        """
+        Write the compiled schema, together with the store's prefix bindings
+        and the alias map, to a file. Passing the filename as the schema
+        argument of another ThingFactory sets that factory up the same way,
+        without parsing or compiling the schema.
+
+        path - str filename
+        """
+        self._schema_bundle().save(path)
+
+    def _schema_bundle(self):
+        """
+        Return the compiled schema together with the store's prefix bindings
+        and the alias map, enough to set up an equivalent factory elsewhere.
+        """
+        schema = self.schema
+        if schema is self._live_schema:
+            schema = SchemaIndex.compile(self._schema_view())
+        return SchemaIndex(schema.functional, schema.restrictions, schema.ranges, schema.domains,
+                           dict(self.store.namespaces()), dict(self.alias_map))
+
+    def invalidate_schema(self):
+        """
+        Discard the compiled SchemaIndex, so that it is rebuilt from
+        schema_store on next use. Needed with compile_schema=True after
+        changing the schema store other than through this factory, e.g. by
+        parsing more schema into it, unless the schema store is backed by a
+        TrackedStore.
+        """
+        self._schema = None
+
+    def addAlias(self, alias, uri):
+        """
+        Add an alias for an pythonic name to a URI, which overrides the 
+        default prefix_localname syntax for properties and object names. Intended to 
+        be used for URIs which are unmappable.
+        
+        E.g., 
+          .addAlias("foobar", "http://example.com/my-unmappable-types#blah-type")
+        will map the .foobar property to the provided URI.
+        """
+        self.alias_map[alias] = uri
+        self._uris = {}
+        self._names = {}
+
+    @contextmanager
+    def batch(self):
+        """
+        Buffer the writes made through this factory's Things and write them to
+        the store in bulk when the block exits. A statement that is added then
+        removed (or removed then added) is never written. Reads inside the
+        block see the buffered writes. If the block raises, the buffered
+        writes are discarded. Nested blocks join the outermost one.
+
+        E.g.,
+          with factory.batch():
+              for row in rows:
+                  factory(None, **row)
+        """
+        batch = self._current_batch()
+        if batch is not None:
+            yield batch
+            return
+        if self._local is None:
+            batch = self._batch = _Batch(self.store)
+            self._view = self._wrap(batch)
+        else:
+            batch = self._local.batch = _Batch(self.store, _LockedView(self.store, self._lock))
+        try:
+            yield batch
+        finally:
+            if self._local is None:
+                self._batch = None
+                self._view = self._wrap(self._reader())
+            else:
+                self._local.batch = None
+            # Nothing read while the batch was open stays cached, whether
+            # its writes are flushed or discarded
+            self._writes += 1
+        removed, added = self._write(batch.flush)
+        if self.stats is not None:
+            if removed:
+                self.stats.count('store_writes', 'remove', removed)
+            if added:
+                self.stats.count('store_writes', 'addN')
+        if batch.schema_version:
+            self._schema_writes += 1
+
+    def enable_stats(self, hook=None):
+        """
+        Start gathering statistics about how this factory and its Things use
+        the store, its caches and their time, for finding out why an access is
+        slow. Until then, the only cost is a check in a few methods.
+        Timings are recorded for Thing's _AttrToURI, _isUniqueObject,
+        _getObjectTypes, _rdf_to_python and _python_to_rdf.
+
+        E.g.,
+          stats = factory.enable_stats()
+          ross.foaf_name
+          stats.snapshot()['store_calls']  # e.g. {'SP?': 1}
+
+        hook - callable(kind, name, value) to call on each event, e.g. to feed
+               a metrics system
+
+        returns FactoryStats instance, also available as self.stats
+        """
+        if self.stats is None:
+            self.stats = FactoryStats()
+            self._view = self._wrap(self._reader())
+        if hook is not None:
+            self.stats.hooks.append(hook)
+        return self.stats
+
+    def disable_stats(self):
+        """
+        Stop gathering statistics.
+        """
+        self.stats = None
+        self._view = self._wrap(self._reader())
+
+    def _reader(self):
+        """
+        Return what Things should read from: the store or the active _Batch,
+        or if threadsafe, a _LockedView that reads from the calling thread's
+        batch if it has one.
+        """
+        if self._lock is not None:
+            return _LockedView(self.store, self._lock, self._local)
+        return self._batch if self._batch is not None else self.store
+
+    def _wrap(self, view):
+        """
+        Return view, wrapped to count reads if stats are enabled.
+        """
+        return view if self.stats is None else _CountingView(view, self.stats)
+
+    def _current_batch(self):
+        if self._local is None:
+            return self._batch
+        return getattr(self._local, 'batch', None)
+
+    def _write(self, method, *args):
+        """
+        Call a method that writes to the store, holding the write lock if
+        threadsafe.
+        """
+        try:
+            if self._lock is None:
+                return method(*args)
+            with self._lock.writing():
+                return method(*args)
+        finally:
+            # Counted once the write is done, so that a read made during it
+            # is not cached as current
+            self._writes += 1
+
+    def invalidate_cache(self):
+        """
+        Forget the attribute values remembered if the factory was made with
+        cache=True. Only needed if the store has been changed other than
+        through this factory or a Graph over its TrackedStore.
+        """
+        self._writes += 1
+
+    def _cached(self, thing, pred):
+        """
+        Return how an attribute of a Thing reads, from the read cache if it
+        was read there since anything was last written. While the calling
+        thread has a batch open, reads go to the batch and are not cached,
+        as its writes may yet be discarded. Nor are reads answered from what
+        the Thing prefetched, which may be older than the store.
+
+        returns (unique, value) tuple, as from Thing._read()
+        """
+        if self._current_batch() is not None:
+            return thing._read(pred)
+        prefetched = thing._prefetched
+        if prefetched and (pred in prefetched or
+                           (RDF.type in prefetched and pred in self.schema.restrictions)):
+            return thing._read(pred)
+        tracker, schema_tracker = self._tracker, self._schema_tracker
+        version = (tracker.version if tracker is not None else None,
+                   schema_tracker.version if schema_tracker is not None else None,
+                   self._writes)
+        cache = self._cache
+        if version != self._cache_version or len(cache) >= READ_CACHE_SIZE:
+            cache.clear()
+            self._cache_version = version
+        key = (thing._id, pred, thing._lang)
+        # Each entry holds the version it was read at, so that a read that
+        # overlapped a write in another thread is never taken as current
+        entry = cache.get(key)
+        if entry is not None and entry[0] != version:
+            entry = None
+        if self.stats is not None:
+            self.stats.count('cache_misses' if entry is None else 'cache_hits', 'reads')
+        if entry is None:
+            entry = cache[key] = (version, thing._read(pred))
+        return entry[1]
+
+    def _add(self, triple):
+        batch = self._current_batch()
+        if batch is None:
+            if self.stats is not None:
+                self.stats.count('store_writes', 'add')
+            self._write(self.store.add, triple)
+            if _touches_schema(triple[1], triple[2]):
+                self._schema_writes += 1
+        else:
+            batch.add(triple)
+
+    def _add_all(self, triples):
+        batch = self._current_batch()
+        if batch is None:
+            if self.stats is not None:
+                self.stats.count('store_writes', 'addN')
+            self._write(_add_triples, self.store, triples)
+            if any(_touches_schema(p, o) for (_, p, o) in triples):
+                self._schema_writes += 1
+        else:
+            batch.addN(triples)
 
+    def _remove(self, pattern):
+        batch = self._current_batch()
+        if batch is None:
+            if self.stats is not None:
+                self.stats.count('store_writes', 'remove')
+            self._write(self.store.remove, pattern)
+            if _touches_schema(pattern[1], pattern[2]):
+                self._schema_writes += 1
+        else:
+            batch.remove(pattern)
 
-RDF_SEQi = "http://www.w3.org/1999/02/22-rdf-syntax-ns#_%s"
-MAX_CARD = URI("http://www.w3.org/2002/07/owl#maxCardinality")
-CARD = URI("http://www.w3.org/2002/07/owl#cardinality")
-RESTRICTION = URI("http://www.w3.org/2002/07/owl#Restriction")
-FUNC_PROP = URI("http://www.w3.org/2002/07/owl#FunctionalProperty")
-ON_PROP = URI("http://www.w3.org/2002/07/owl#onProperty")
-ONE = Literal("1")
+    def _replace(self, subj, pred, obj):
+        """
+        Replace all values of a predicate on a subject with one value, as one
+        write.
+        """
+        self._write(self._replace_unlocked, subj, pred, obj)
 
+    def _replace_unlocked(self, subj, pred, obj):
+        self._remove((subj, pred, None))
+        self._add((subj, pred, obj))
 
-class ThingFactory(object):
-    """
-    Fed a store, return a factory that can be used to instantiate
-    Things into that world.
-    """
-    def __init__(self, store, schema_store=None, alias_map=None):
+    def prefetch(self, things, attrs):
         """
-        store - rdflib.Graph.Graph instance
-        schema_store - rdflib.Graph.Graph instance; defaults to store
+        Load the values of some properties for many Things at once, so that
+        reading those properties from the Things afterwards doesn't query the
+        store. A SPARQL endpoint is asked with one query per property for up
+        to SCAN_SUBJECTS Things; other stores are read as _scan() describes.
+        The values are a snapshot: a Thing only sees later writes made
+        through itself, until invalidate_prefetched() drops them. With
+        intern=True, the Things given are no longer the ones factory()
+        returns for their nodes.
+
+        things - iterable of Thing instances; anything else is passed over
+        attrs - list of str in the form prefix_localname, or URIs
+
+        returns list of the items in things
         """
-        self.store = store
-        self.schema_store = schema_store or self.store
-        self.alias_map = alias_map or {}
+        things = list(things)
+        preds = [attr if isinstance(attr, ID) else self._attr_to_uri(attr) for attr in attrs]
+        # Restricted cardinalities depend on the subject's types, so load those too
+        schema = self.schema
+        if RDF.type not in preds and any(pred in schema.restrictions for pred in preds):
+            preds.append(RDF.type)
 
-    def __call__(self, ident=None, **props):
+        subjects = set(thing._id for thing in things if isinstance(thing, Thing))
+        fetched = dict((pred, self._scan(subjects, pred)) for pred in preds)
+        for thing in things:
+            if isinstance(thing, Thing):
+                if thing._prefetched is None:
+                    thing._prefetched = {}
+                    self._detach(thing)
+                for pred in preds:
+                    thing._prefetched[pred] = tuple(fetched[pred].get(thing._id, ()))
+        return things
+
+    def invalidate_prefetched(self, things, attrs=None):
         """
-        ident - either:
-            a) None  (creates a new BNode)
-            b) rdflib.URIRef.URIRef instance
-            c) str in the form prefix_localname
-        props - dict of properties and values, to be added. If the value is a list, its
-                contents will be added to a ResourceSet.
+        Drop the values prefetch() loaded into some Things, so that they read
+        the store again. Otherwise a Thing keeps them for as long as it lives.
 
-        returns Thing instance
+        things - iterable of Thing instances; anything else is passed over
+        attrs - list of str in the form prefix_localname, or URIs; defaults
+                to all the prefetched properties
         """
-        return Thing(self.store, self.schema_store, self.alias_map, ident, props)
+        preds = self._preds(attrs)
+        for thing in things:
+            if isinstance(thing, Thing) and thing._prefetched is not None:
+                if preds is None:
+                    thing._prefetched = None
+                else:
+                    for pred in preds:
+                        thing._forget(pred)
 
-    def addAlias(self, alias, uri):
+    def _scan(self, subjects, pred):
         """
-        Add an alias for an pythonic name to a URI, which overrides the 
-        default prefix_localname syntax for properties and object names. Intended to 
-        be used for URIs which are unmappable.
-        
-        E.g., 
-          .addAlias("foobar", "http://example.com/my-unmappable-types#blah-type")
-        will map the .foobar property to the provided URI.
+        Find the objects of a predicate for many subjects, reading no more of
+        the store than needed: with a query per SCAN_SUBJECTS subjects (bound
+        with VALUES) from a SPARQL endpoint, with a lookup per subject from a
+        store that indexes in memory, if there are no more subjects than
+        SCAN_SUBJECTS, and otherwise with one scan of the predicate, so that
+        a database is asked once rather than once per subject.
+
+        subjects - set of rdflib.Identifier instances
+        pred - rdflib.URIRef.URIRef instance
+
+        returns dict mapping each subject that has values to a list of them
         """
-        self.alias_map[alias] = uri
+        found = {}
+        view = self._view
+        if isinstance(getattr(view, 'store', None), SPARQLStore):
+            named = [subj for subj in subjects if not isinstance(subj, BNode)]
+            for start in range(0, len(named), SCAN_SUBJECTS):
+                query = "SELECT ?s ?o WHERE { VALUES ?s { %s } ?s %s ?o }" % (
+                    " ".join(subj.n3() for subj in named[start:start + SCAN_SUBJECTS]), pred.n3())
+                for (subj, obj) in view.query(query):
+                    found.setdefault(subj, []).append(obj)
+            subjects = [subj for subj in subjects if isinstance(subj, BNode)]
+        elif len(subjects) > SCAN_SUBJECTS or not _indexed_in_memory(self.store.store):
+            for (subj, obj) in view.subject_objects(pred):
+                if subj in subjects:
+                    found.setdefault(subj, []).append(obj)
+            return found
+        for subj in subjects:
+            objs = list(view.objects(subj, pred))
+            if objs:
+                found[subj] = objs
+        return found
+
+    def column(self, things, attr, dtype=None):
+        """
+        Extract the value of a property from many Things into a NumPy masked
+        array, reading the store as prefetch() does. Requires NumPy.
+
+        things - iterable of Thing instances
+        attr - str in the form prefix_localname, or a URI
+        dtype - NumPy dtype for the array; by default this comes from the
+                property's rdfs:range if that is an XML Schema datatype, or
+                else from the datatype of the first value found
+
+        returns numpy.ma.MaskedArray instance, masked where a Thing has no
+        value or a value that can't be read as dtype. If a Thing has several
+        values, one of them is used.
+        """
+        pred = attr if isinstance(attr, ID) else self._attr_to_uri(attr)
+        ids = [thing._id for thing in things]
+        found = self._scan(set(ids), pred)
+        literals = [found[i][0] if i in found else None for i in ids]
+        return _to_array(literals, self._dtype(pred, dtype))
+
+    def to_columns(self, subjects, attrs, multi='first', lang=None, arrays=False):
+        """
+        Tabulate properties of many Things: one row per subject and one column
+        per attribute. Each predicate is read for all the subjects at once, as
+        prefetch() reads it.
+
+        subjects - iterable of Thing instances
+        attrs - list of str in the form prefix_localname, or URIs
+        multi - what a cell holds when a subject has several values:
+            'first' - one of them (whichever the store yields first), or None
+            'list' - a list of all of them
+            'count' - the number of them
+        lang - if given, only literals in that language (or with no language)
+               are used, as for ResourceSet
+        arrays - if True, 'first' and 'count' columns are returned as NumPy
+                 (masked) arrays rather than lists. Requires NumPy.
+
+        returns OrderedDict mapping each attribute to its column
+        """
+        if multi not in ('first', 'list', 'count'):
+            raise ValueError('Unknown multi-value policy: %s' % multi)
+        ids = [thing._id for thing in subjects]
+        subject_set = set(ids)
+        converter = self._converter()
+        columns = OrderedDict()
+        for attr in attrs:
+            pred = attr if isinstance(attr, ID) else self._attr_to_uri(attr)
+            found = self._scan(subject_set, pred)
+            if lang:
+                for (subj, objs) in found.items():
+                    found[subj] = [obj for obj in objs if _matches_lang(obj, lang)]
+            if multi == 'count':
+                column = [len(found.get(i, ())) for i in ids]
+                if arrays:
+                    column = _numpy().array(column)
+            elif multi == 'first':
+                terms = [found[i][0] if found.get(i) else None for i in ids]
+                if arrays:
+                    column = _to_array(terms, self._dtype(pred))
+                else:
+                    column = [None if term is None else converter._rdf_to_python(pred, term)
+                              for term in terms]
+            else:
+                column = [[converter._rdf_to_python(pred, term) for term in found.get(i, ())]
+                          for i in ids]
+            columns[attr] = column
+        return columns
+
+    def map(self, fn, subjects, workers=None, ordered=True, chunksize=256):
+        """
+        Call a function on the Thing for each of many subjects, spread over
+        worker processes. Each worker sets up an equivalent ThingFactory once:
+        over the same SnapshotStore file if the store is one, or else over a
+        copy of the store inherited by forking (or, where processes cannot be
+        forked, a temporary snapshot of it), with this factory's schema,
+        prefixes and aliases. Writes made by fn stay in its worker's copy.
+
+        E.g.,
+          for report in factory.map(make_report, factory.where(rdf_type=Person), workers=32):
+              write(report)
+
+        fn - picklable callable taking a Thing and returning a picklable result
+        subjects - iterable of Thing instances, or idents as for __call__
+        workers - int number of processes; defaults to one per CPU. With 1, fn
+                  is called in this process.
+        ordered - if True, results come in the order of subjects; otherwise
+                  as they are ready
+        chunksize - int subjects sent to a worker at a time
+
+        returns iterator yielding the result of fn for each subject
+        """
+        idents = (s._id if isinstance(s, Thing) else self._node(s) for s in subjects)
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        if workers <= 1:
+            return (fn(self._thing(Thing, ident)) for ident in idents)
+        return self._map(fn, idents, workers, ordered, chunksize)
+
+    def _map(self, fn, idents, workers, ordered, chunksize):
+        options = {'intern': self._things is not None, 'copy_options': self.copy_options,
+                   'schema': self._schema_bundle()}
+        context, forks = _pool_context()
+        snapshot, temporary = None, None
+        if isinstance(getattr(self.store, 'store', None), SnapshotStore):
+            snapshot = self.store.store.path
+        elif not forks:
+            handle, snapshot = tempfile.mkstemp(suffix='.snapshot')
+            os.close(handle)
+            temporary = snapshot
+            write_snapshot(self.store, snapshot)
+        # Registered under a token of this call's own, so that calls made at
+        # the same time (e.g. from several threads) each fork their own store
+        token = next(_map_tokens)
+        if snapshot is None:
+            _map_stores[token] = self.store
+        pool = context.Pool(workers, _map_init, (snapshot, options, fn, token))
+        try:
+            chunks = iter(lambda: list(itertools.islice(idents, chunksize)), [])
+            results = (pool.imap if ordered else pool.imap_unordered)(_map_chunk, chunks)
+            for chunk in results:
+                for result in chunk:
+                    yield result
+            pool.close()
+        finally:
+            _map_stores.pop(token, None)
+            pool.terminate()
+            pool.join()
+            if temporary is not None:
+                os.remove(temporary)
+
+    def _preds(self, attrs):
+        """
+        Resolve a list of attribute names or URIs to a set of predicates.
+
+        returns set of rdflib.URIRef.URIRef instances, or None if attrs is None
+        """
+        if attrs is None:
+            return None
+        return set(a if isinstance(a, ID) else self._attr_to_uri(a) for a in attrs)
+
+    def write_jsonld(self, f, things, depth=0, include=None, lang=None):
+        """
+        Write many Things to a file as one JSON-LD document, a Thing at a time,
+        with the store's prefixes as its @context. Each Thing is read with one
+        scan; arguments are as for Thing.to_dict(), with nesting and references
+        worked out separately for each Thing.
+
+        E.g.,
+          factory.write_jsonld(response, factory.where(rdf_type=Person), depth=1)
+
+        f - text file object
+        things - iterable of Thing instances
+        """
+        preds = self._preds(include)
+        self._check_bindings()
+        context = dict((_text(prefix), _text(namespace))
+                       for (prefix, namespace) in self.store.namespaces() if prefix)
+        f.write(u'{"@context": %s, "@graph": [' % json.dumps(context, sort_keys=True))
+        for (i, thing) in enumerate(things):
+            node = thing._jsonld(depth, preds, lang if lang is not None else thing._lang, set())
+            f.write((u',\n' if i else u'\n') + json.dumps(node, allow_nan=False))
+        f.write(u'\n]}\n')
+
+    def stream(self, source, format='nt'):
+        """
+        Read a file of N-Triples or N-Quads whose statements are grouped by
+        subject (as a sorted dump is), and yield a Thing for each subject as
+        soon as its statements have been read, without loading the file into
+        a store. Memory use is bounded by the largest subject.
+
+        Each Thing is backed by a small store holding only its subject's
+        statements, which is emptied when the next Thing is yielded: read what
+        is needed from it, or copyTo() it elsewhere, before moving on. This
+        factory's schema, prefixes and aliases drive cardinality and type
+        conversion. Graph names in N-Quads are ignored, and a subject whose
+        statements are not together is yielded once per group.
+
+        E.g.,
+          for person in factory.stream('people.nt'):
+              print(person.foaf_name)
+
+        source - str filename or file object
+        format - 'nt' for N-Triples or 'nquads' for N-Quads
+
+        returns iterator yielding Thing instances
+        """
+        if format not in ('nt', 'nquads'):
+            raise ValueError('Unknown streaming format: %s' % format)
+        rolling = Graph()
+        schema = self._schema_bundle()
+        for (prefix, namespace) in schema.namespaces.items():
+            _bind(rolling, prefix, namespace)
+        factory = ThingFactory(rolling, alias_map=self.alias_map, copy_options=self.copy_options,
+                               schema=schema)
+        f = open(source, 'rb') if isinstance(source, str) else source
+        try:
+            statements = _read_statements(f, quads=format == 'nquads')
+            for (subject, group) in itertools.groupby(statements, lambda t: t[0]):
+                rolling.remove((None, None, None))
+                _add_triples(rolling, group)
+                yield factory(subject)
+        finally:
+            if f is not source:
+                f.close()
+
+    def _dtype(self, pred, dtype=None):
+        """
+        Return the NumPy dtype to use for values of a predicate: dtype if one
+        is given, or else one mapped from its rdfs:range, if there is one.
+        """
+        if dtype is None:
+            for obj_type in self.schema.ranges.get(pred, ()):
+                if obj_type in NUMPY_DTYPES:
+                    return NUMPY_DTYPES[obj_type]
+        return dtype
+
+    def _attr_to_uri(self, attr):
+        """
+        Given an attribute, return a URIRef. Answers for names in the form
+        prefix_localname, including unknown prefixes, are remembered until an
+        alias is added. Each is checked against the store's current binding
+        of its prefix when it is used again, which asks the store one thing
+        rather than resolving the name afresh.
+
+        attr - str in the form prefix_localname, or a URI
+
+        returns rdflib.URIRef.URIRef instance
+        """
+        uris = self._uris
+        resolved = uris.get(attr)
+        if resolved is not None and resolved[1] is not None:
+            namespace = self._namespace(resolved[1])
+            if namespace is not resolved[2] and namespace != resolved[2]:
+                resolved = None
+        if self.stats is not None:
+            self.stats.count('cache_misses' if resolved is None else 'cache_hits', 'attr_to_uri')
+        if resolved is None:
+            resolved = self._lookup_uri(attr)
+            if ':' not in attr:
+                if len(uris) >= NAME_CACHE_SIZE:
+                    uris = self._uris = {}
+                uris[attr] = resolved
+        if resolved[0] is None:
+            raise AttributeError('Unknown prefix: ' + resolved[1])
+        return resolved[0]
+
+    def _namespace(self, prefix):
+        """
+        Return the namespace a prefix is bound to on the store, or None.
+        """
+        return self.store.namespace_manager.store.namespace(prefix)
+
+    def _check_bindings(self):
+        """
+        Forget the attribute names and compact IRIs worked out by _names_of()
+        if the store's prefix bindings have changed since. Called once by each
+        method that uses them, rather than on every lookup.
+        """
+        bindings = frozenset(self.store.namespaces())
+        if bindings != self._names_bindings:
+            self._names = {}
+            self._names_bindings = bindings
+
+    def _names_of(self, uri):
+        """
+        Given a URI, return the attribute name that resolves to it (an alias,
+        prefix_localname, or else the URI itself) and its compact IRI
+        (prefix:localname, or else the URI itself). Answers are remembered
+        until an alias is added or _check_bindings() finds the prefix
+        bindings changed.
+
+        returns (str, str) tuple
+        """
+        cache = self._names
+        names = cache.get(uri)
+        if names is None:
+            names = self._lookup_names(uri)
+            if len(cache) >= NAME_CACHE_SIZE:
+                cache = self._names = {}
+            cache[uri] = names
+        return names
+
+    def _lookup_names(self, uri):
+        text = str(uri)
+        attr = compact = None
+        for (alias, aliased) in list(self.alias_map.items()):
+            if str(aliased) == text:
+                attr = alias
+                break
+        best = ''
+        for (prefix, namespace) in self.store.namespaces():
+            namespace = str(namespace)
+            if prefix and len(namespace) > len(best) and text.startswith(namespace) and \
+               len(text) > len(namespace):
+                best = namespace
+                compact = (prefix, text[len(namespace):])
+        if compact is None:
+            return (attr or text, text)
+        if attr is None:
+            attr = '%s_%s' % compact if '_' not in compact[0] else text
+        return (attr, '%s:%s' % compact)
+
+    def _lookup_uri(self, attr):
+        """
+        Resolve an attribute against the alias map and the store's prefix
+        bindings.
+
+        attr - str in the form prefix_localname, or a URI
+
+        returns (URI, prefix, namespace) tuple: the rdflib.URIRef.URIRef
+        instance, or None if the prefix is unknown, and the prefix and the
+        namespace it is bound to, if the URI came from one
+        """
+        if ':' in attr:
+            return (URI(attr), None, None)
+
+        if attr in self.alias_map:
+            return (URI(self.alias_map[attr]), None, None)
+        else:
+            prefix, localname = attr.split("_", 1)
+            namespace = self._namespace(prefix)
+            if namespace:
+                return (URI(namespace + localname), prefix, namespace)
+            else:
+                return (None, prefix, namespace)
     
+# Set up by ThingFactory.map() in each worker process
+_map_factory = None
+_map_fn = None
+# The stores forked workers inherit, by the token of the map() call
+_map_stores = {}
+_map_tokens = itertools.count()
+
+
+def _pool_context():
+    """
+    Return the multiprocessing context to start map() workers from, which
+    forks them where it can, and whether it does.
+    """
+    if not hasattr(multiprocessing, 'get_context'):
+        # Python 2 forks wherever it can, and has no other way there
+        return multiprocessing, hasattr(os, 'fork')
+    forks = 'fork' in multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('fork' if forks else None), forks
+
+
+def _map_init(snapshot, options, fn, token):
+    global _map_factory, _map_fn
+    store = _map_stores[token] if snapshot is None else Graph(store=SnapshotStore(snapshot))
+    _map_factory, _map_fn = ThingFactory(store, **options), fn
+
+
+def _map_chunk(idents):
+    return [_map_fn(_map_factory._thing(Thing, ident)) for ident in idents]
+
+
 class Thing(object):
     """ An RDF resource, as uniquely identified by a URI. Properties
         of the resource are available as attributes; for example:
@@ -109,7 +2036,7 @@ class Thing(object):
             c) a list containing a and/or b
     """
     
-    def __init__(self, store, schema_store, alias_map, ident=None, props=None):
+    def __init__(self, store, schema_store, alias_map, ident=None, props=None, factory=None):
         """
         store - rdflib.Graph.Graph
         schema_store - rdflib.Graph.Graph
@@ -119,15 +2046,24 @@ class Thing(object):
             c) str in the form prefix_localname
         props - dict of properties and values, to be added. If the value is a list, its
                 contents will be added to a ResourceSet.
+        factory - the ThingFactory this Thing belongs to; one is made if not given
         """
         self._store = store
         self._schema_store = schema_store
         self._alias_map = alias_map
+        self._factory = factory or ThingFactory(store, schema_store, alias_map)
 
         self._id = self._AttrToURI(ident)
 
         self._lang = None
+        self._prefetched = None
+
+        self._add_props(props)
 
+    def _add_props(self, props):
+        """
+        props - dict of properties and values, as for __init__
+        """
         if props is not None:
             for attr, obj in props.items():
                 if isinstance(obj, list):
@@ -135,7 +2071,7 @@ class Thing(object):
                         self.__getattr__(attr).add(o)
                 else:
                     self.__setattr__(attr, obj)
-        
+
     def __getattr__(self, attr):
         """
         attr - either:
@@ -155,14 +2091,38 @@ class Thing(object):
         else:
             pred = self._AttrToURI(attr)
 
+            if self._factory._cache is not None:
+                unique, value = self._factory._cached(self, pred)
+                if not unique:
+                    return ResourceSet(self, pred, lang=self._lang)
+                elif value is _MISSING:
+                    raise AttributeError
+                # Copied so that changing the list doesn't change the cache
+                return list(value) if isinstance(value, list) else value
+
             if self._isUniqueObject(pred):
                 try:
-                    obj = next(self._store.objects(self._id, pred))
+                    obj = next(self._objects(pred))
                 except StopIteration:
                     raise AttributeError
                 return self._rdf_to_python(pred, obj)
             else:
                 return ResourceSet(self, pred, lang=self._lang)
+
+    def _read(self, pred):
+        """
+        Read an attribute, for the read cache.
+
+        pred - rdflib.URIRef.URIRef instance
+
+        returns (unique, value) tuple: whether the predicate has a cardinality
+        of one, and if so its value (or _MISSING if it has none)
+        """
+        if not self._isUniqueObject(pred):
+            return (False, None)
+        for obj in self._objects(pred):
+            return (True, self._rdf_to_python(pred, obj))
+        return (True, _MISSING)
                 
     def __setattr__(self, attr, obj):
         """
@@ -174,15 +2134,17 @@ class Thing(object):
         """
         if attr == 'lang':
             self._lang = obj
+            if obj is not None:
+                self._factory._detach(self)
         elif attr[0] == '_':
             self.__dict__[attr] = obj
         else:
             pred = self._AttrToURI(attr)
 
             if self._isUniqueObject(pred):
-                self._store.remove((self._id, pred, None))
+                self._forget(pred)
                 obj_rdf = self._python_to_rdf(pred, obj)
-                self._store.add((self._id, pred, obj_rdf))
+                self._factory._replace(self._id, pred, obj_rdf)
             elif isinstance(obj, ResourceSet) or type(obj) is type(set()):
                 ResourceSet(self, pred, iterable=obj.copy(), lang=self._lang)
             else:
@@ -198,37 +2160,68 @@ class Thing(object):
         if attr[0] == '_':
             del self.__dict__[attr]
         else:
-            self._store.remove((self._id, self._AttrToURI(attr), None))
+            pred = self._AttrToURI(attr)
+            self._forget(pred)
+            self._factory._remove((self._id, pred, None))
+
+    def _objects(self, pred):
+        """
+        Iterate over the objects of a predicate on this Thing, from the
+        prefetched snapshot if there is one for that predicate.
+
+        pred - rdflib.URIRef.URIRef instance
+        """
+        if self._prefetched is not None:
+            objs = self._prefetched.get(pred)
+            stats = self._factory.stats
+            if stats is not None:
+                stats.count('cache_misses' if objs is None else 'cache_hits', 'prefetched')
+            if objs is not None:
+                return iter(objs)
+        return self._factory._view.objects(self._id, pred)
 
-    def _rdf_to_python(self, pred, obj, inverse=False):
+    def _subjects(self, pred):
+        """
+        Iterate over the subjects linked to this Thing by a predicate.
+
+        pred - rdflib.URIRef.URIRef instance
+        """
+        return self._factory._view.subjects(pred, self._id)
+
+    def _forget(self, pred):
+        """
+        Drop any prefetched values of a predicate that is being written.
+
+        pred - rdflib.URIRef.URIRef instance
+        """
+        if self._prefetched is not None:
+            self._prefetched.pop(pred, None)
+
+    @_timed
+    def _rdf_to_python(self, pred, obj, inverse=False, types=None):
         """
         Given a RDF predicate and object, return the equivalent Python object.
         
         pred - rdflib.URIRef instance
         obj - rdflib.Identifier instance
+        types - obj's rdf:types, if already read; only rdf:List and rdf:Seq
+                matter
 
         returns a python data representation
         """ 
-        obj_types = self._getObjectTypes(pred, obj, inverse=inverse)
+        obj_types = self._getObjectTypes(pred, obj, inverse=inverse, types=types)
         if isinstance(obj, Literal):  # typed literals
             return obj.toPython()
         elif RDF.List in obj_types:
             return self._listToPython(obj)
         elif RDF.Seq in obj_types:
-            l, i = [], 1
-            while True:
-                counter = URI(RDF_SEQi % i)
-                try:
-                    item = next(self._store.objects(obj, counter))
-                except StopIteration:
-                    return l
-                l.append(self._rdf_to_python(counter, item))
-                i += 1
+            return list(self._iterSeq(obj))
         elif isinstance(obj, ID):
-            return self.__class__(self._store, self._schema_store, self._alias_map, obj)
+            return self._factory._thing(self.__class__, obj)
         else:
             raise ValueError
 
+    @_timed
     def _python_to_rdf(self, pred, obj, lang=None):
         """
         Given a Python predicate and object, return the equivalent RDF object.
@@ -241,27 +2234,45 @@ class Thing(object):
         obj_types = self._getObjectTypes(pred, obj)
 
         if RDF.List in obj_types:
+            if not obj:
+                return RDF.nil
             blank = BNode()
             self._pythonToList(blank, obj)   ### this actually stores things... 
             return blank
 
         elif RDF.Seq in obj_types:  ### so will this
             blank = BNode()
-            i = 1
-            for item in obj:
+            triples = []
+            for i, item in enumerate(obj, 1):
                 counter = URI(RDF_SEQi % i)
-                self._store.add((blank, counter, self._python_to_rdf(counter, item)))
-                i += 1
+                triples.append((blank, counter, self._python_to_rdf(counter, item)))
+            self._factory._add_all(triples)
             return blank
 
         elif isinstance(obj, self.__class__):
             if obj._store is not self._store:
-                obj.copyTo(self._store)  ### and this...
+                # Copied through the factory, so that a batch can discard it
+                for triples in obj._copied(**self._factory.copy_options):
+                    self._factory._add_all(triples)
             return obj._id
 
         else:
             return self._python_to_literal(obj, obj_types, lang=lang)
 
+    def _python_to_term(self, pred, obj):
+        """
+        Given a predicate and a Python object, return the RDF term to look for
+        in the store. Unlike _python_to_rdf, this never stores anything.
+
+        pred - rdflib.URIRef.URIRef instance
+        obj - a python literal datatype or a self.__class__ instance
+
+        returns rdflib.Identifier.Identifier instance
+        """
+        if isinstance(obj, self.__class__):
+            return obj._id
+        return self._python_to_literal(obj, self._getObjectTypes(pred, obj))
+
     def _python_to_literal(self, obj, obj_types, lang=None):
         """
         obj - a python literal datatype
@@ -281,32 +2292,89 @@ class Thing(object):
 
         returns list of python data representations
         """
-        try:
-            first = next(self._store.objects(subj, RDF.first))
-        except StopIteration:
-            return []
-        try:
-            rest = next(self._store.objects(subj, RDF.rest))
-        except StopIteration:
-            return ValueError
-        return [self._rdf_to_python(RDF.first, first)] + self._listToPython(rest)  ### type first?
+        return list(self._iterList(subj))
+
+    def _iterList(self, subj):
+        """
+        Given a RDF list, lazily yield the equivalent Python values.
+
+        subj - rdflib.Identifier instance
+
+        returns generator of python data representations
+        """
+        for item in self._list_terms(subj):
+            yield self._rdf_to_python(RDF.first, item)  ### type first?
+
+    def _list_terms(self, subj):
+        """
+        Given a RDF list, lazily yield its members as RDF terms. Each cell is
+        read with a single store lookup, and a cyclic rdf:rest is detected
+        (using Brent's algorithm, so without remembering every cell).
+
+        subj - rdflib.Identifier instance
+
+        returns generator of rdflib.Identifier instances
+        """
+        checkpoint, power, steps = None, 1, 0
+        while True:
+            first = rest = None
+            for (p, o) in self._factory._view.predicate_objects(subj):
+                if p == RDF.first and first is None:
+                    first = o
+                elif p == RDF.rest and rest is None:
+                    rest = o
+            if first is None:
+                return
+            if rest is None:
+                raise ValueError('rdf:List cell has no rdf:rest: %s' % subj)
+            yield first
+
+            subj = rest
+            if subj == checkpoint:
+                raise ValueError('rdf:List is cyclic at: %s' % subj)
+            steps += 1
+            if steps == power:
+                checkpoint, power, steps = subj, power * 2, 0
+
+    def _iterSeq(self, subj):
+        """
+        Given a RDF sequence, lazily yield the equivalent Python values, up to
+        the first gap in its numbering. The members are found with a single
+        store lookup.
+
+        subj - rdflib.Identifier instance
+
+        returns generator of python data representations
+        """
+        members = {}
+        for (p, o) in self._factory._view.predicate_objects(subj):
+            if p.startswith(RDF_SEQ_PREFIX):
+                try:
+                    members.setdefault(int(p[len(RDF_SEQ_PREFIX):]), (p, o))
+                except ValueError:
+                    pass
+        i = 1
+        while i in members:
+            counter, item = members.pop(i)
+            yield self._rdf_to_python(counter, item)
+            i += 1
 
     def _pythonToList(self, subj, members):
         """
-        Given a Python list, store the eqivalent RDF list.
+        Given a Python list, store the eqivalent RDF list. The cells are all
+        written with one batched call.
         
         subj - rdflib.Identifier.Identifier instance
-        members - list of python data representations
+        members - non-empty list of python data representations
         """
-        first = self._python_to_rdf(RDF.first, members[0])
-        self._store.add((subj, RDF.first, first))
-        if len(members) > 1:
-            blank = BNode()
-            self._store.add((subj, RDF.rest, blank))
-            self._pythonToList(blank, members[1:])
-        else:
-            self._store.add((subj, RDF.rest, RDF.nil))
-            
+        cells = [subj] + [BNode() for _ in range(len(members) - 1)]
+        triples = []
+        for cell, member, rest in zip(cells, members, cells[1:] + [RDF.nil]):
+            triples.append((cell, RDF.first, self._python_to_rdf(RDF.first, member)))
+            triples.append((cell, RDF.rest, rest))
+        self._factory._add_all(triples)
+
+    @_timed
     def _AttrToURI(self, attr):
         """
         Given an attribute, return a URIRef.
@@ -321,38 +2389,33 @@ class Thing(object):
         if attr is None:
             return BNode()
 
-        if ':' in attr:
-            return URI(attr)
-
-        if attr in self._alias_map:
-            return URI(self._alias_map[attr])
-        else:
-            prefix, localname = attr.split("_", 1)
-            namespace = self._store.namespace_manager.store.namespace(prefix)
-            if namespace:
-                return URI(namespace + localname)
-            else:
-                raise AttributeError('Unknown prefix: ' + prefix)
+        return self._factory._attr_to_uri(attr)
 
-    def _getObjectTypes(self, pred, obj, inverse=False):
+    @_timed
+    def _getObjectTypes(self, pred, obj, inverse=False, types=None):
         """
         Given a predicate and an object, return a list of the object's types.
         
         pred - rdflib.URIRef instance
         obj - rdflib.Identifier instance
+        types - obj's rdf:types, if already read, rather than reading them
         
         returns list containing rdflib.Identifier instances
         """
+        schema = self._factory.schema
         if inverse:
-            obj_types = list(self._schema_store.objects(pred, RDFS.domain))
+            obj_types = list(schema.domains.get(pred, ()))
         else:
-            obj_types = list(self._schema_store.objects(pred, RDFS.range))
+            obj_types = list(schema.ranges.get(pred, ()))
 
-        if isinstance(obj, URI):
-            obj_types += list(self._store.objects(obj, RDF.type))
+        if types is not None:
+            obj_types += list(types)
+        elif isinstance(obj, URI):
+            obj_types += list(self._factory._view.objects(obj, RDF.type))
 
         return obj_types
 
+    @_timed
     def _isUniqueObject(self, pred):
         """
         Given a predicate, figure out if the object has a cardinality greater than one.
@@ -361,43 +2424,261 @@ class Thing(object):
         
         returns bool
         """
+        schema = self._factory.schema
+        stats = self._factory.stats
         # pred rdf:type owl:FunctionalProperty - True
-        if (pred, RDF.type, FUNC_PROP) in self._schema_store:
+        if pred in schema.functional:
+            if stats is not None:
+                stats.count('cardinality_checks', 'functional')
             return True
         # subj rdf:type [ rdfs:subClassOf [ a owl:Restriction; owl:onProperty pred; owl:maxCardinality "1" ]] - True
         # subj rdf:type [ rdfs:subClassOf [ a owl:Restriction; owl:onProperty pred; owl:cardinality "1" ]] - True
-        subj_types = [o for (_, _, o) in self._store.triples((self._id, RDF.type, None))]
-        for type in subj_types:
-            superclasses = [o for (s, p, o) in \
-              self._schema_store.objects(type, RDFS.subClassOf)]
-            for superclass in superclasses:
-                if (
-                    (superclass, RDF.type, RESTRICTION) in self._schema_store and
-                    (superclass, ON_PROP, pred) in self._schema_store
-                   ) and \
-                   (
-                    (superclass, MAX_CARD, ONE) in self._schema_store or 
-                    (superclass, CARD, ONE) in self._schema_store
-                   ): return True
+        classes = schema.restrictions.get(pred)
+        if stats is not None:
+            stats.count('cardinality_checks', 'restricted' if classes else 'unrestricted')
+        if classes:
+            for subj_type in self._objects(RDF.type):
+                if subj_type in classes:
+                    return True
         return False
 
-    def __repr__(self):
-        return self._id
-        
-    def __str__(self):
-        return str(self._id)
-                
-    def __eq__(self, other):
-        if isinstance(other, self.__class__):
-            return self._id == other._id
-        elif isinstance(other, ID):
-            return self._id == other
-    
-    def __ne__(self, other):
-        return not self.__eq__(other)
+    def __repr__(self):
+        return self._id
+        
+    def __str__(self):
+        return str(self._id)
+                
+    def __eq__(self, other):
+        if isinstance(other, self.__class__):
+            return self._id == other._id
+        elif isinstance(other, ID):
+            return self._id == other
+    
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self._id)
+
+    def members(self, attr):
+        """
+        Lazily iterate over the values of a property whose value is an
+        rdf:List or rdf:Seq, without building the whole Python list.
+
+        attr - str in the form prefix_localname, or a URI
+
+        returns generator of python data representations
+        """
+        pred = self._AttrToURI(attr)
+        try:
+            obj = next(self._factory._view.objects(self._id, pred))
+        except StopIteration:
+            raise AttributeError(attr)
+        obj_types = self._getObjectTypes(pred, obj)
+        if RDF.List in obj_types:
+            return self._iterList(obj)
+        elif RDF.Seq in obj_types:
+            return self._iterSeq(obj)
+        else:
+            raise ValueError('%s is not an rdf:List or rdf:Seq' % obj)
+
+    def path(self, steps, distinct=True):
+        """
+        Follow a chain of properties from this Thing, and iterate over the
+        values at the end of it. The whole path is evaluated in one go: by
+        the store as a SPARQL property path if it is a SPARQL endpoint, or by
+        rdflib's path evaluation otherwise, so no Thing is made for the
+        intermediate nodes.
+
+        E.g.,
+          bob.path("foaf_knows/foaf_name")
+          bob.path("foaf_knows+/foaf_name")   # people Bob knows, directly or not
+          bob.path(["foaf_member_of", "foaf_name"])
+
+        steps - either:
+            a) str of steps separated by "/"
+            b) list of steps (needed if a step is a full URI)
+          where each step is an attribute name or URI, optionally ending in
+          _of (for the inverse property) and then one of "+", "*" or "?" (for
+          one or more, zero or more, or zero or one repetitions)
+        distinct - if True, each value is yielded only once
+
+        returns generator of python data representations
+        """
+        if not isinstance(steps, (list, tuple)):
+            steps = steps.split("/")
+        compiled = []
+        for step in steps:
+            repeat = None
+            if step[-1:] in ("+", "*", "?"):
+                step, repeat = step[:-1], step[-1]
+            inverse = step.endswith("_of")
+            if inverse:
+                step = step[:-3]
+            pred = self._AttrToURI(step)
+            compiled.append(InvPath(pred) if inverse else pred)
+            if repeat is not None:
+                compiled[-1] = MulPath(compiled[-1], repeat)
+        path = compiled[0] if len(compiled) == 1 else SequencePath(*compiled)
+        return self._follow(path, pred, inverse, distinct)
+
+    def _follow(self, path, pred, inverse, distinct):
+        """
+        Evaluate a property path from this Thing, yielding the Python values
+        of the nodes it reaches.
+
+        path - rdflib.paths.Path or rdflib.URIRef.URIRef instance
+        pred - rdflib.URIRef.URIRef instance; the last predicate in the path
+        inverse - whether the last step of the path is inverted
+        """
+        view = self._factory._view
+        if isinstance(getattr(view, 'store', None), SPARQLStore) and \
+           not isinstance(self._id, BNode):
+            query = "SELECT %s ?o WHERE { %s %s ?o }" % (
+                "DISTINCT" if distinct else "", self._id.n3(), path.n3())
+            ends = (row[0] for row in view.query(query))
+        elif isinstance(path, URI):
+            ends = view.objects(self._id, path)
+        else:
+            ends = (o for (_, o) in path.eval(view, self._id))
+
+        seen = set()
+        for obj in ends:
+            if distinct:
+                if obj in seen:
+                    continue
+                seen.add(obj)
+            if _matches_lang(obj, self._lang):
+                yield self._rdf_to_python(pred, obj, inverse=inverse)
+
+    def to_dict(self, depth=0, include=None, lang=None):
+        """
+        Return this Thing as a dict of attribute name (an alias, or
+        prefix_localname, or else the URI) to value, plus its URI as '@id'.
+        Its statements are read with one scan and converted as attribute
+        access converts them: a property with a cardinality of one maps to a
+        value, and any other to a list.
+
+        Linked Things are nested as dicts up to depth links away. Beyond that,
+        or if they are already nested elsewhere in the result (as in a cycle),
+        they are given as {'@id': uri} references.
+
+        depth - int
+        include - list of attribute names or URIs; only these properties are
+                  given, at every level
+        lang - language to filter literals by; defaults to self.lang
+
+        returns dict
+        """
+        preds = self._factory._preds(include)
+        self._factory._check_bindings()
+        return self._to_dict(depth, preds, lang if lang is not None else self._lang, set())
+
+    def _to_dict(self, depth, preds, lang, seen):
+        seen.add(self._id)
+        data = {'@id': _node_id(self._id)}
+        for (pred, objs) in self._grouped(preds, lang).items():
+            values = [self._dict_value(self._rdf_to_python(pred, o), depth, preds, lang, seen)
+                      for o in objs]
+            data[self._factory._names_of(pred)[0]] = \
+                values[0] if self._isUniqueObject(pred) else values
+        return data
+
+    def _dict_value(self, value, depth, preds, lang, seen):
+        if isinstance(value, Thing):
+            if depth > 0 and value._id not in seen:
+                return value._to_dict(depth - 1, preds, lang, seen)
+            return {'@id': _node_id(value._id)}
+        elif isinstance(value, list):
+            return [self._dict_value(v, depth, preds, lang, seen) for v in value]
+        return value
+
+    def _grouped(self, preds, lang):
+        """
+        Read this Thing's statements with one scan, grouped by predicate.
+
+        preds - set of predicates to keep, or None for all of them
+        lang - language to filter literals by, or None
+
+        returns OrderedDict of predicate to list of objects
+        """
+        groups = OrderedDict()
+        for (_, p, o) in self._factory._view.triples((self._id, None, None)):
+            if (preds is None or p in preds) and _matches_lang(o, lang):
+                groups.setdefault(p, []).append(o)
+        return groups
+
+    def _jsonld(self, depth, preds, lang, seen):
+        """
+        Return this Thing as a JSON-LD node object, with compact IRIs for
+        the store's prefixes. Arguments are as for to_dict().
+        """
+        seen.add(self._id)
+        names = self._factory._names_of
+        node = {'@id': _node_id(self._id) if isinstance(self._id, BNode) else names(self._id)[1]}
+        for (pred, objs) in self._grouped(preds, lang).items():
+            if pred == RDF.type:
+                node['@type'] = [names(o)[1] if isinstance(o, URI) else _node_id(o) for o in objs]
+                continue
+            values = [self._jsonld_value(pred, o, depth, preds, lang, seen) for o in objs]
+            node[names(pred)[1]] = values[0] if self._isUniqueObject(pred) else values
+        return node
+
+    def _jsonld_value(self, pred, obj, depth, preds, lang, seen):
+        names = self._factory._names_of
+        if isinstance(obj, Literal):
+            if obj.language:
+                return {'@value': _text(obj), '@language': obj.language}
+            native = JSON_NATIVE.get(obj.datatype)
+            if native is not None and isinstance(obj.value, native):
+                if native is not float or not (math.isinf(obj.value) or math.isnan(obj.value)):
+                    return obj.value
+                # NaN and the infinities have no JSON number
+                value = obj.value
+                lexical = 'NaN' if math.isnan(value) else ('INF' if value > 0 else '-INF')
+                return {'@value': lexical, '@type': names(obj.datatype)[1]}
+            if obj.datatype is None or obj.datatype == URI(XSD + 'string'):
+                return _text(obj)
+            return {'@value': _text(obj), '@type': names(obj.datatype)[1]}
+        if RDF.List in self._getObjectTypes(pred, obj):
+            return {'@list': [self._jsonld_value(RDF.first, item, depth, preds, lang, seen)
+                              for item in self._list_terms(obj)]}
+        if depth > 0 and obj not in seen:
+            return self._factory._thing(self.__class__, obj)._jsonld(depth - 1, preds, lang, seen)
+        return {'@id': _node_id(obj) if isinstance(obj, BNode) else names(obj)[1]}
 
-    def __hash__(self):
-        return hash(self._id)
+    def snapshot(self, inverse=False, lang=None):
+        """
+        Read all of this Thing's statements in one scan (and with inverse,
+        those linking other nodes to it in one more), and return them as a
+        read-only ThingSnapshot mapping, which answers repeated reads without
+        querying the store again. The Thing itself is left as it was, and
+        goes on reading the store.
+
+        E.g.,
+          page = ross.snapshot()
+          render(page['foaf_name'], page['foaf_knows'])
+
+        inverse - if True, include properties linking other nodes to this
+                  Thing, keyed prefix_localname_of
+        lang - language to filter literals by; defaults to self.lang
+
+        returns ThingSnapshot instance
+        """
+        forward = self._grouped(None, None)
+        backward = OrderedDict()
+        if inverse:
+            for (s, p, _) in self._factory._view.triples((None, None, self._id)):
+                backward.setdefault(p, []).append(s)
+        self._factory._check_bindings()
+        return ThingSnapshot(self, forward, backward, lang if lang is not None else self._lang)
+
+    def items(self, inverse=False, lang=None):
+        """
+        Return (attribute name, value) pairs for all of this Thing's
+        properties, read in one scan. Arguments are as for snapshot().
+        """
+        return list(self.snapshot(inverse, lang).items())
 
     def properties(self):
         """
@@ -405,19 +2686,55 @@ class Thing(object):
         
         returns list containing self.__class__ instances
         """
-        return [self.__class__(self._store, self._schema_store, self._alias_map, p)
-                for (_, p, _) in self._store.triples((self._id, None, None))]
+        return [self._factory._thing(self.__class__, p) for p in self._grouped(None, None)]
 
-    def copyTo(self, store):
+    def copyTo(self, store, depth=None, bnodes_only=False, predicates=None):
         """
-        Recursively copy statements to the given store.
+        Copy statements about this Thing to the given store, along with the
+        statements about the nodes they link to. Each node is visited once, so
+        cyclic data is safe, and statements are written in batches.
         
         store - rdflib.Store.Store
+        depth - how many links away from this Thing to copy; 0 copies only the
+                statements about this Thing. None (the default) has no limit.
+        bnodes_only - only follow links to blank nodes, which copies the
+                      Concise Bounded Description of this Thing
+        predicates - if given, a list of attribute names or URIs; only
+                     statements with these predicates are copied or followed
+        """
+        for triples in self._copied(depth, bnodes_only, predicates):
+            _add_triples(store, triples)
+
+    def _copied(self, depth=None, bnodes_only=False, predicates=None):
         """
-        for (s, p, o) in self._store.triples((self._id, None, None)):
-            store.add((s, p, o))
-            if isinstance(o, (URI, BNode)):
-                self.__class__(self._store, self._schema_store, self._alias_map, o).copyTo(store)
+        Read the statements copyTo() copies, in batches of up to
+        COPY_BATCH_SIZE. Arguments are as for copyTo().
+
+        returns generator of lists of (s, p, o) tuples
+        """
+        if predicates is not None:
+            predicates = set(self._AttrToURI(p) for p in predicates)
+        follow = BNode if bnodes_only else (URI, BNode)
+        seen = set([self._id])
+        frontier, level, triples = [self._id], 0, []
+        while frontier:
+            linked = []
+            for node in frontier:
+                for (s, p, o) in self._factory._view.triples((node, None, None)):
+                    if predicates is not None and p not in predicates:
+                        continue
+                    triples.append((s, p, o))
+                    if isinstance(o, follow) and o not in seen:
+                        seen.add(o)
+                        linked.append(o)
+                if len(triples) >= COPY_BATCH_SIZE:
+                    yield triples
+                    triples = []
+            if depth is not None and level >= depth:
+                break
+            frontier, level = linked, level + 1
+        if triples:
+            yield triples
         
         
 class ResourceSet(object):
@@ -434,58 +2751,91 @@ class ResourceSet(object):
         self._subject = subject
         self._predicate = predicate
         self._store = subject._store
+        self._factory = subject._factory
         self._inverse = inverse
         self._lang = lang
         if iterable is not None:
             for obj in iterable:
                 self.add(obj)
 
-    def __len__(self):
+    def _terms(self):
+        """
+        Iterate over the RDF terms in this set that pass the lang filter,
+        without converting them to Python.
+        """
         if self._inverse:
-            return len(list(self._store.subjects(self._predicate, self._subject._id)))
+            terms = self._subject._subjects(self._predicate)
         else:
-            return len(list(self._store.objects(self._subject._id, self._predicate)))
+            terms = self._subject._objects(self._predicate)
+        if not self._lang:
+            return terms
+        return (term for term in terms if self._matches_lang(term))
+
+    def _to_python(self, term):
+        return self._subject._rdf_to_python(self._predicate, term, inverse=self._inverse)
+
+    def __len__(self):
+        count = 0
+        for _ in self._terms():
+            count += 1
+        return count
+
+    def __bool__(self):
+        for _ in self._terms():
+            return True
+        return False
+
+    __nonzero__ = __bool__
 
     def _obj_to_rdf(self, obj):
-        if isinstance(obj, type(self._subject)):
-            obj = obj._id
-        elif self._inverse:
+        if self._inverse and not isinstance(obj, type(self._subject)):
             return self._subject._python_to_literal(obj, [], lang=self._lang)
-        else: ### doesn't use pythonToRdf because that might store it
-            obj_types = self._subject._getObjectTypes(self._predicate, obj) 
-            obj = self._subject._python_to_literal(obj, obj_types)
-        return obj
-        
+        else:
+            return self._subject._python_to_term(self._predicate, obj)
 
-    def __contains__(self, obj):
-        obj = self._obj_to_rdf(obj)
+    def _lang_terms(self, obj):
+        """
+        With a lang filter, a plain string stands for two terms: the literal
+        tagged with the filter's language and the untagged one it would
+        otherwise be. Return them.
+        """
+        tagged, untagged = Literal(obj, lang=self._lang), self._obj_to_rdf(obj)
+        return [tagged] if untagged == tagged else [tagged, untagged]
+
+    def _has(self, term):
+        prefetched = self._subject._prefetched
+        if prefetched is not None and not self._inverse:
+            terms = prefetched.get(self._predicate)
+            if terms is not None:
+                return term in terms
         if self._inverse:
-            return (obj, self._predicate, self._subject._id) in self._store
+            return (term, self._predicate, self._subject._id) in self._factory._view
         else:
-            return (self._subject._id, self._predicate, obj) in self._store
+            return (self._subject._id, self._predicate, term) in self._factory._view
+
+    def __contains__(self, obj):
+        if self._lang and isinstance(obj, str) and not isinstance(obj, ID):
+            return any(self._has(term) for term in self._lang_terms(obj))
+        obj = self._obj_to_rdf(obj)
+        return self._matches_lang(obj) and self._has(obj)
 
     def __iter__(self):
-        if self._inverse:
-            for s in self._store.subjects(self._predicate, self._subject._id):
-                if self._matches_lang(s):
-                    yield self._subject._rdf_to_python(self._predicate, s, inverse=True)
-        else:
-            for o in self._store.objects(self._subject._id, self._predicate):
-                if self._matches_lang(o):
-                    yield self._subject._rdf_to_python(self._predicate, o)
+        for term in self._terms():
+            yield self._to_python(term)
 
     def _matches_lang(self, o):
-        return not self._lang or not isinstance(o, Literal) or o.language == self._lang or not o.language or o.language.startswith(self._lang)
+        return _matches_lang(o, self._lang)
 
     def copy(self):
         return set(self)
 
     def add(self, obj, lang=None):
         rdf_obj = self._subject._python_to_rdf(self._predicate, obj, lang=lang)
+        self._subject._forget(self._predicate)
         if self._inverse:
-            self._store.add((rdf_obj, self._predicate, self._subject._id))
+            self._factory._add((rdf_obj, self._predicate, self._subject._id))
         else:
-            self._store.add((self._subject._id, self._predicate, rdf_obj))
+            self._factory._add((self._subject._id, self._predicate, rdf_obj))
 
     def remove(self, obj):
         if not obj in self:
@@ -493,14 +2843,829 @@ class ResourceSet(object):
         self.discard(obj)
 
     def discard(self, obj):
-        obj = self._obj_to_rdf(obj)
-        if self._inverse:
-            self._store.remove((obj, self._predicate, self._subject._id))
+        """
+        Remove obj from the set, if it is there. With a lang filter, a plain
+        string is removed both as a literal in the filter's language and as
+        an untagged literal, the two terms that `in` looks for; literals in
+        other languages, or of other datatypes, are left alone.
+        """
+        if self._lang and isinstance(obj, str) and not isinstance(obj, ID):
+            terms = self._lang_terms(obj)
         else:
-            self._store.remove((self._subject._id, self._predicate, obj))
+            terms = [self._obj_to_rdf(obj)]
+        self._subject._forget(self._predicate)
+        for term in terms:
+            if self._inverse:
+                self._factory._remove((term, self._predicate, self._subject._id))
+            else:
+                self._factory._remove((self._subject._id, self._predicate, term))
+
+    def first(self, default=None):
+        """
+        Return a member of the set (whichever the store yields first),
+        converting only that member, or default if the set is empty.
+        """
+        for term in self._terms():
+            return self._to_python(term)
+        return default
 
     def any(self):
-        if len(list(self.copy())) > 0:
-            return list(self.copy())[0]
+        return self.first()
+
+    def to_array(self, dtype=None):
+        """
+        Return the members of this set as a NumPy masked array; see
+        ThingFactory.column. Requires NumPy.
+
+        dtype - NumPy dtype for the array; by default this comes from the
+                predicate's rdfs:range or the datatype of the first member
+
+        returns numpy.ma.MaskedArray instance
+        """
+        return _to_array(list(self._terms()), self._factory._dtype(self._predicate, dtype))
+
+    def prefetch(self, attrs):
+        """
+        Load the given properties of every member of this set in one pass; see
+        ThingFactory.prefetch.
+
+        attrs - list of str in the form prefix_localname, or URIs
+
+        returns list of the members of this set
+        """
+        return self._subject._factory.prefetch(self, attrs)
+
+
+class _Ordering(object):
+    """
+    Statements sorted by one permutation (x, y, z) of subject, predicate and
+    object, as integer IDs. Those with x == i are at positions offsets[i] up
+    to offsets[i + 1] of ys and zs, sorted by y and then z.
+    """
+    __slots__ = ('offsets', 'ys', 'zs')
+
+    def __init__(self, offsets, ys, zs):
+        self.offsets = offsets
+        self.ys = ys
+        self.zs = zs
+
+    def span(self, x, y=None):
+        """
+        Return the (start, end) positions of the statements with the given x
+        and, optionally, y.
+        """
+        offsets = self.offsets
+        if x + 1 >= len(offsets):
+            return 0, 0
+        lo, hi = offsets[x], offsets[x + 1]
+        if y is not None:
+            lo, hi = bisect.bisect_left(self.ys, y, lo, hi), bisect.bisect_right(self.ys, y, lo, hi)
+        return lo, hi
+
+
+class _Segment(object):
+    """
+    An immutable set of statements as integer IDs, indexed three ways
+    (SPO, POS and OSP) so that any triple pattern is answered from a
+    contiguous run of one index.
+    """
+    def __init__(self, spo, pos, osp):
+        self.spo = spo
+        self.pos = pos
+        self.osp = osp
+        self.size = spo.offsets[-1] if len(spo.offsets) else 0
+
+    @classmethod
+    def build(cls, subjects, predicates, objects, num_terms):
+        """
+        Index some statements, dropping duplicates.
+
+        subjects, predicates, objects - equal length sequences of term IDs
+        num_terms - one more than the largest term ID
+
+        returns _Segment instance
+        """
+        spo = _sort_ordering(subjects, predicates, objects, num_terms)
+        subjects, predicates, objects = _expand_ordering(spo)
+        return cls(spo,
+                   _sort_ordering(predicates, objects, subjects, num_terms),
+                   _sort_ordering(objects, subjects, predicates, num_terms))
+
+    def __len__(self):
+        return self.size
+
+    def match(self, s, p, o):
+        """
+        Yield the (s, p, o) ID triples matching a pattern, where None matches
+        anything.
+        """
+        if s is not None:
+            if p is not None:
+                lo, hi = self.spo.span(s, p)
+                zs = self.spo.zs
+                if o is not None:
+                    i = bisect.bisect_left(zs, o, lo, hi)
+                    if i < hi and zs[i] == o:
+                        yield (s, p, o)
+                else:
+                    for i in range(lo, hi):
+                        yield (s, p, zs[i])
+            elif o is not None:
+                lo, hi = self.osp.span(o, s)
+                zs = self.osp.zs
+                for i in range(lo, hi):
+                    yield (s, zs[i], o)
+            else:
+                lo, hi = self.spo.span(s)
+                ys, zs = self.spo.ys, self.spo.zs
+                for i in range(lo, hi):
+                    yield (s, ys[i], zs[i])
+        elif p is not None:
+            lo, hi = self.pos.span(p, o)
+            ys, zs = self.pos.ys, self.pos.zs
+            for i in range(lo, hi):
+                yield (zs[i], p, ys[i])
+        elif o is not None:
+            lo, hi = self.osp.span(o)
+            ys, zs = self.osp.ys, self.osp.zs
+            for i in range(lo, hi):
+                yield (ys[i], zs[i], o)
         else:
-            return None
+            offsets, ys, zs = self.spo.offsets, self.spo.ys, self.spo.zs
+            for s in range(len(offsets) - 1):
+                for i in range(offsets[s], offsets[s + 1]):
+                    yield (s, ys[i], zs[i])
+
+
+def _sort_ordering(xs, ys, zs, num_terms):
+    """
+    Sort statements given as three columns of term IDs into an _Ordering on
+    (x, y, z), dropping duplicates. Uses NumPy if it is available.
+
+    returns _Ordering instance
+    """
+    n = len(xs)
+    if numpy is not None and n:
+        xs, ys, zs = (numpy.frombuffer(_id_array(col), dtype=numpy.int32) for col in (xs, ys, zs))
+        order = numpy.lexsort((zs, ys, xs))
+        xs, ys, zs = xs[order], ys[order], zs[order]
+        keep = numpy.ones(n, dtype=bool)
+        keep[1:] = (xs[1:] != xs[:-1]) | (ys[1:] != ys[:-1]) | (zs[1:] != zs[:-1])
+        xs, ys, zs = xs[keep], ys[keep], zs[keep]
+        offsets = numpy.zeros(num_terms + 1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(xs, minlength=num_terms), out=offsets[1:])
+        return _Ordering(array(_INT64, offsets.tobytes()), array('i', ys.tobytes()),
+                         array('i', zs.tobytes()))
+
+    bits = max(num_terms, 1).bit_length()
+    mask = (1 << bits) - 1
+    keys = sorted(set((x << (2 * bits)) | (y << bits) | z for (x, y, z) in zip(xs, ys, zs)))
+    counts = array(_INT64, [0]) * (num_terms + 1)
+    for key in keys:
+        counts[(key >> (2 * bits)) + 1] += 1
+    for i in range(num_terms):
+        counts[i + 1] += counts[i]
+    return _Ordering(counts, array('i', ((key >> bits) & mask for key in keys)),
+                     array('i', (key & mask for key in keys)))
+
+
+def _expand_ordering(ordering):
+    """
+    Return the three columns (xs, ys, zs) of an _Ordering as arrays of IDs.
+    """
+    offsets = ordering.offsets
+    xs = array('i')
+    for x in range(len(offsets) - 1):
+        xs.extend(array('i', [x]) * (offsets[x + 1] - offsets[x]))
+    return xs, array('i', ordering.ys), array('i', ordering.zs)
+
+
+def _id_array(ids):
+    return ids if isinstance(ids, array) and ids.typecode == 'i' else array('i', ids)
+
+
+def _array_bytes(ids):
+    """
+    Return the contents of an array as bytes; Python 2's arrays have no
+    tobytes().
+    """
+    return ids.tobytes() if hasattr(ids, 'tobytes') else ids.tostring()
+
+
+class _BindingStore(Store):
+    """
+    Base for Laconia's own stores, which keep prefix bindings in memory the
+    way rdflib's Memory store does.
+    """
+    def __init__(self, configuration=None, identifier=None):
+        self._namespace = {}
+        self._prefix = {}
+        Store.__init__(self, configuration, identifier)
+
+    def bind(self, prefix, namespace, override=True):
+        bound_namespace = self._namespace.get(prefix)
+        bound_prefix = self._prefix.get(namespace) or self._prefix.get(bound_namespace)
+        if override:
+            if bound_prefix is not None:
+                del self._namespace[bound_prefix]
+            if bound_namespace is not None:
+                del self._prefix[bound_namespace]
+            self._prefix[namespace] = prefix
+            self._namespace[prefix] = namespace
+        else:
+            self._prefix[bound_namespace or namespace] = bound_prefix or prefix
+            self._namespace[bound_prefix or prefix] = bound_namespace or namespace
+
+    def namespace(self, prefix):
+        return self._namespace.get(prefix)
+
+    def prefix(self, namespace):
+        return self._prefix.get(namespace)
+
+    def namespaces(self):
+        for (prefix, namespace) in list(self._namespace.items()):
+            yield prefix, namespace
+
+
+class CompactStore(_BindingStore):
+    """
+    An rdflib store that keeps each term once, numbered with an integer ID,
+    and indexes statements as sorted arrays of those IDs. It uses a fraction
+    of the memory of rdflib's Memory store for large graphs, and is intended
+    to be bulk loaded with load().
+
+    Statements added one at a time go into a small dict-based delta, which is
+    merged into the arrays once it grows past a fraction of their size.
+
+    E.g.,
+      store = Graph(store=CompactStore())
+      store.store.load('dump.nt')
+      Thing = ThingFactory(store)
+    """
+    context_aware = False
+    formula_aware = False
+    transaction_aware = False
+    graph_aware = False
+
+    def __init__(self, configuration=None, identifier=None):
+        _BindingStore.__init__(self, configuration, identifier)
+        self._ids = {}
+        self._terms = []
+        self._base = _Segment.build([], [], [], 0)
+        self._added = set()
+        self._removed = set()
+        self._by_position = ({}, {}, {})
+
+    def _intern(self, term):
+        i = self._ids.get(term)
+        if i is None:
+            i = self._ids[term] = len(self._terms)
+            self._terms.append(term)
+        return i
+
+    def _lookup(self, pattern):
+        """
+        Return the IDs of the terms in a triple pattern, or None if any of
+        them has never been seen (so nothing can match).
+        """
+        ids = []
+        for term in pattern:
+            if term is None:
+                ids.append(None)
+            else:
+                i = self._ids.get(term)
+                if i is None:
+                    return None
+                ids.append(i)
+        return ids
+
+    def load(self, source):
+        """
+        Bulk load statements from an N-Triples file, indexing them in one go.
+
+        source - str filename or binary file object
+        """
+        subjects, predicates, objects = array('i'), array('i'), array('i')
+        intern = self._intern
+
+        class Sink(object):
+            def triple(self, s, p, o):
+                subjects.append(intern(s))
+                predicates.append(intern(p))
+                objects.append(intern(o))
+
+        f = open(source, 'rb') if isinstance(source, (str, _text)) else source
+        try:
+            W3CNTriplesParser(Sink()).parse(f)
+        finally:
+            if f is not source:
+                f.close()
+        self._merge(subjects, predicates, objects)
+
+    def add(self, triple, context=None, quoted=False):
+        t = tuple(self._intern(term) for term in triple)
+        self._add_ids(t)
+        self._maybe_merge()
+
+    def addN(self, quads):
+        subjects, predicates, objects = array('i'), array('i'), array('i')
+        for (s, p, o, _) in quads:
+            subjects.append(self._intern(s))
+            predicates.append(self._intern(p))
+            objects.append(self._intern(o))
+        if len(subjects) > max(COMPACT_MIN_DELTA, len(self._base) // COMPACT_RATIO):
+            self._merge(subjects, predicates, objects)
+        else:
+            for t in zip(subjects, predicates, objects):
+                self._add_ids(t)
+            self._maybe_merge()
+
+    def _add_ids(self, t):
+        if t in self._removed:
+            self._removed.discard(t)
+        elif t not in self._added and not any(True for _ in self._base.match(*t)):
+            self._added.add(t)
+            for (index, term) in zip(self._by_position, t):
+                index.setdefault(term, set()).add(t)
+
+    def remove(self, triple, context=None):
+        ids = self._lookup(triple)
+        if ids is None:
+            return
+        for t in list(self._match_ids(*ids)):
+            if t in self._added:
+                self._added.discard(t)
+                for (index, term) in zip(self._by_position, t):
+                    index[term].discard(t)
+            else:
+                self._removed.add(t)
+        self._maybe_merge()
+
+    def _maybe_merge(self):
+        if len(self._added) + len(self._removed) > \
+           max(COMPACT_MIN_DELTA, len(self._base) // COMPACT_RATIO):
+            self._merge(array('i'), array('i'), array('i'))
+
+    def _merge(self, subjects, predicates, objects):
+        """
+        Rebuild the indexes from everything in the store plus the given
+        statements, emptying the delta.
+        """
+        if self._removed:
+            live = [t for t in self._base.match(None, None, None) if t not in self._removed]
+            base = tuple(array('i', column) for column in zip(*live)) or \
+                (array('i'), array('i'), array('i'))
+        else:
+            base = _expand_ordering(self._base.spo)
+        added = list(zip(*self._added)) or [(), (), ()]
+        for (column, extra, more) in zip(base, (subjects, predicates, objects), added):
+            column.extend(extra)
+            column.extend(array('i', more))
+        self._base = _Segment.build(base[0], base[1], base[2], len(self._terms))
+        self._added, self._removed = set(), set()
+        self._by_position = ({}, {}, {})
+
+    def _match_ids(self, s, p, o):
+        removed = self._removed
+        for t in self._base.match(s, p, o):
+            if t not in removed:
+                yield t
+        if self._added:
+            for (index, term) in zip(self._by_position, (s, p, o)):
+                if term is not None:
+                    candidates = index.get(term, ())
+                    break
+            else:
+                candidates = self._added
+            for t in list(candidates):
+                if (s is None or t[0] == s) and (p is None or t[1] == p) and (o is None or t[2] == o):
+                    yield t
+
+    def triples(self, triple_pattern, context=None):
+        ids = self._lookup(triple_pattern)
+        if ids is None:
+            return
+        terms = self._terms
+        for (s, p, o) in self._match_ids(*ids):
+            yield (terms[s], terms[p], terms[o]), iter(())
+
+    def __len__(self, context=None):
+        return len(self._base) - len(self._removed) + len(self._added)
+
+    def contexts(self, triple=None):
+        return iter(())
+
+
+def _term_bytes(term):
+    """
+    Encode an RDF term as bytes, which _bytes_term turns back into an equal
+    term. A literal's lexical form goes last, as the only part that might
+    contain a NUL.
+    """
+    encoded = _encode_term(term)
+    if encoded[0] == 'l':
+        encoded = ('l' + encoded[2], encoded[3], encoded[1])
+    else:
+        encoded = (encoded[0] + encoded[1],)
+    return '\0'.join(encoded).encode('utf-8')
+
+
+def _bytes_term(data):
+    """
+    Given bytes from _term_bytes, return the RDF term.
+    """
+    parts = memoryview(data).tobytes().decode('utf-8')
+    kind = parts[0]
+    if kind == 'l':
+        lang, datatype, value = parts[1:].split('\0', 2)
+        return _decode_term(('l', value, lang, datatype))
+    return _decode_term((kind, parts[1:]))
+
+
+def _padding(size):
+    return b'\0' * (-size % 8)
+
+
+def write_snapshot(graph, path):
+    """
+    Write the statements and prefix bindings of a graph to a snapshot file,
+    which SnapshotStore opens without parsing. The file holds a term
+    dictionary sorted by encoded term and the SPO, POS and OSP indexes of
+    CompactStore, in the byte order of the machine that wrote it.
+
+    graph - rdflib.Graph.Graph instance
+    path - str filename
+    """
+    ids = {}
+    columns = (array('i'), array('i'), array('i'))
+    for triple in graph.triples((None, None, None)):
+        for (column, term) in zip(columns, triple):
+            i = ids.get(term)
+            if i is None:
+                i = ids[term] = len(ids)
+            column.append(i)
+
+    encoded = sorted((_term_bytes(term), i) for (term, i) in ids.items())
+    renumber = array('i', [0]) * len(encoded)
+    term_offsets = array(_INT64, [0])
+    for (new, (data, old)) in enumerate(encoded):
+        renumber[old] = new
+        term_offsets.append(term_offsets[-1] + len(data))
+    blob = b''.join(data for (data, _) in encoded)
+    subjects, predicates, objects = (array('i', (renumber[i] for i in column)) for column in columns)
+    spo = _sort_ordering(subjects, predicates, objects, len(encoded))
+    subjects, predicates, objects = _expand_ordering(spo)
+    orderings = (spo,
+                 _sort_ordering(predicates, objects, subjects, len(encoded)),
+                 _sort_ordering(objects, subjects, predicates, len(encoded)))
+
+    with open(path, 'wb') as f:
+        f.write(struct.pack('=8sqqq', SNAPSHOT_MAGIC, len(encoded), len(spo.ys), len(blob)))
+        f.write(_array_bytes(term_offsets))
+        f.write(blob + _padding(len(blob)))
+        for ordering in orderings:
+            for column in (ordering.offsets, ordering.ys, ordering.zs):
+                data = _array_bytes(column)
+                f.write(data + _padding(len(data)))
+        f.write(''.join('%s %s\n' % (prefix, namespace)
+                        for (prefix, namespace) in graph.namespaces()).encode('utf-8'))
+
+
+class SnapshotStore(_BindingStore):
+    """
+    A read-only rdflib store over a file written by write_snapshot(). The
+    file is memory-mapped rather than read, so opening it is near-instant
+    and processes on the same host share its pages. (Python 2 can't view a
+    map, so there the file is read into memory.)
+
+    Prefix bindings come from the snapshot; changes to them stay in memory.
+
+    E.g.,
+      write_snapshot(graph, 'data.snapshot')
+      Thing = ThingFactory(Graph(store=SnapshotStore('data.snapshot')))
+    """
+    context_aware = False
+    formula_aware = False
+    transaction_aware = False
+    graph_aware = False
+
+    def __init__(self, configuration=None, identifier=None):
+        self._file = None
+        _BindingStore.__init__(self, configuration, identifier)
+
+    def open(self, configuration, create=False):
+        """
+        Map a snapshot file.
+
+        configuration - str filename
+        """
+        self.close()
+        self.path = configuration
+        with open(configuration, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            view = memoryview(self._mmap)
+        except TypeError:
+            # Python 2 can't view a map, so the file is read into memory
+            view = memoryview(self._mmap[:])
+        self._file = view
+        header = struct.calcsize('=8sqqq')
+        magic, num_terms, num_triples, blob_len = struct.unpack('=8sqqq', view[:header].tobytes())
+        if magic != SNAPSHOT_MAGIC:
+            self.close()
+            raise ValueError('Not a Laconia snapshot: %s' % configuration)
+
+        def take(size, fmt):
+            start = self._position
+            self._position += size + (-size % 8)
+            data = view[start:start + size]
+            if not fmt:
+                return data
+            if hasattr(data, 'cast'):
+                return data.cast(fmt)
+            # Python 2's views can't be cast, so the column is copied
+            return array(fmt, data.tobytes())
+
+        self._position = header
+        self._term_offsets = take(8 * (num_terms + 1), _INT64)
+        self._blob = take(blob_len, None)
+        orderings = [_Ordering(take(8 * (num_terms + 1), _INT64), take(4 * num_triples, 'i'),
+                               take(4 * num_triples, 'i')) for _ in range(3)]
+        self._base = _Segment(*orderings)
+        for line in view[self._position:].tobytes().decode('utf-8').splitlines():
+            prefix, namespace = line.split(' ', 1)
+            self.bind(prefix, URI(namespace))
+        return 1
+
+    def close(self, commit_pending_transaction=False):
+        """
+        Unmap the snapshot file. Iterators from triples() that are part way
+        through keep working, and the file is unmapped once they are done.
+        """
+        if self._file is not None:
+            self._term_offsets = self._blob = self._base = self._file = None
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Unfinished iterators still hold views of the map
+                pass
+            self._mmap = None
+
+    def _id(self, term):
+        """
+        Find a term's ID by binary search of the sorted term dictionary.
+
+        returns int, or None if the term is not in the snapshot
+        """
+        key = _term_bytes(term)
+        offsets, blob = self._term_offsets, self._blob
+        lo, hi = 0, len(offsets) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if blob[offsets[mid]:offsets[mid + 1]].tobytes() < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(offsets) - 1 and blob[offsets[lo]:offsets[lo + 1]].tobytes() == key:
+            return lo
+        return None
+
+    def triples(self, triple_pattern, context=None):
+        ids = []
+        for term in triple_pattern:
+            i = None if term is None else self._id(term)
+            if term is not None and i is None:
+                return
+            ids.append(i)
+        # Held here rather than read from self, so that close() leaves the
+        # iteration working
+        offsets, blob, terms = self._term_offsets, self._blob, {}
+        for t in self._base.match(*ids):
+            triple = []
+            for i in t:
+                term = terms.get(i)
+                if term is None:
+                    term = terms[i] = _bytes_term(blob[offsets[i]:offsets[i + 1]])
+                triple.append(term)
+            yield tuple(triple), iter(())
+
+    def __len__(self, context=None):
+        return len(self._base)
+
+    def contexts(self, triple=None):
+        return iter(())
+
+    def add(self, triple, context=None, quoted=False):
+        raise TypeError('SnapshotStore is read-only')
+
+    def addN(self, quads):
+        raise TypeError('SnapshotStore is read-only')
+
+    def remove(self, triple, context=None):
+        raise TypeError('SnapshotStore is read-only')
+
+
+class TrackedStore(Store):
+    """
+    An rdflib store that wraps another and counts the writes made to it,
+    through any Graph, so that a ThingFactory made with cache=True can tell
+    when what it has read has gone stale without being told.
+
+    E.g.,
+      store = Graph(store=TrackedStore())
+      Thing = ThingFactory(store, cache=True)
+    """
+    def __init__(self, store=None):
+        """
+        store - rdflib.store.Store instance to wrap; defaults to a new Memory
+                store
+        """
+        Store.__init__(self)
+        self.store = store if store is not None else Memory()
+        self.context_aware = self.store.context_aware
+        self.formula_aware = self.store.formula_aware
+        self.transaction_aware = self.store.transaction_aware
+        self.graph_aware = self.store.graph_aware
+        # How many writes have been made, and how many of them could have
+        # changed a SchemaIndex
+        self.version = 0
+        self.schema_version = 0
+
+    def _written(self, schema):
+        self.version += 1
+        if schema:
+            self.schema_version += 1
+
+    def open(self, configuration, create=False):
+        return self.store.open(configuration, create)
+
+    def close(self, commit_pending_transaction=False):
+        return self.store.close(commit_pending_transaction)
+
+    def destroy(self, configuration):
+        return self.store.destroy(configuration)
+
+    def gc(self):
+        return self.store.gc()
+
+    def add(self, triple, context, quoted=False):
+        try:
+            return self.store.add(triple, context, quoted)
+        finally:
+            self._written(_touches_schema(triple[1], triple[2]))
+
+    def addN(self, quads):
+        touched = []
+
+        def watch(quads):
+            for quad in quads:
+                if not touched and _touches_schema(quad[1], quad[2]):
+                    touched.append(True)
+                yield quad
+        try:
+            return self.store.addN(watch(quads))
+        finally:
+            self._written(bool(touched))
+
+    def remove(self, triple, context=None):
+        try:
+            return self.store.remove(triple, context)
+        finally:
+            self._written(_touches_schema(triple[1], triple[2]))
+
+    def triples_choices(self, triple, context=None):
+        return self.store.triples_choices(triple, context)
+
+    def triples(self, triple_pattern, context=None):
+        return self.store.triples(triple_pattern, context)
+
+    def __len__(self, context=None):
+        return self.store.__len__(context)
+
+    def contexts(self, triple=None):
+        return self.store.contexts(triple)
+
+    def query(self, query, initNs, initBindings, queryGraph, **kwargs):
+        return self.store.query(query, initNs, initBindings, queryGraph, **kwargs)
+
+    def update(self, update, initNs, initBindings, queryGraph, **kwargs):
+        try:
+            return self.store.update(update, initNs, initBindings, queryGraph, **kwargs)
+        finally:
+            self._written(True)
+
+    def bind(self, prefix, namespace, override=True):
+        # Stores from rdflib before 6.2 take no override argument
+        try:
+            return self.store.bind(prefix, namespace, override=override)
+        except TypeError:
+            return self.store.bind(prefix, namespace)
+
+    def prefix(self, namespace):
+        return self.store.prefix(namespace)
+
+    def namespace(self, prefix):
+        return self.store.namespace(prefix)
+
+    def namespaces(self):
+        return self.store.namespaces()
+
+    def commit(self):
+        return self.store.commit()
+
+    def rollback(self):
+        return self.store.rollback()
+
+    def add_graph(self, graph):
+        return self.store.add_graph(graph)
+
+    def remove_graph(self, graph):
+        try:
+            return self.store.remove_graph(graph)
+        finally:
+            self._written(True)
+
+
+class ThingSnapshot(Mapping):
+    """
+    A read-only mapping of a Thing's properties, as read in one scan by
+    Thing.snapshot(). Keys are attribute names (prefix_localname, an alias,
+    or else the URI), with _of appended for properties linking other nodes
+    to the Thing; a property's URI may be used as a key too. Values are
+    converted as attribute access converts them, once: a property with a
+    cardinality of one gives a value, and any other a tuple. Which of the
+    linked nodes are rdf:Lists or rdf:Seqs is read once for the snapshot,
+    rather than once per node.
+    """
+    def __init__(self, thing, forward, backward, lang):
+        """
+        thing - Thing instance
+        forward - dict of predicate to list of objects
+        backward - dict of predicate to list of subjects
+        lang - language to filter literals by, or None
+        """
+        self._thing = thing
+        self._terms = {}
+        self._keys = OrderedDict()
+        self._values = {}
+        self._types = frozenset(forward.get(RDF.type, ()))
+        self._containers = None
+        names = thing._factory._names_of
+        for (groups, inverse) in ((forward, False), (backward, True)):
+            for (pred, terms) in groups.items():
+                terms = [t for t in terms if _matches_lang(t, lang)]
+                if terms:
+                    self._terms[(pred, inverse)] = terms
+                    self._keys[names(pred)[0] + ('_of' if inverse else '')] = (pred, inverse)
+
+    def __getitem__(self, key):
+        key = (key, False) if isinstance(key, ID) else self._keys[key]
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+        terms = self._terms[key]
+        pred, inverse = key
+        thing = self._thing
+        containers = self._container_types() if any(isinstance(t, URI) for t in terms) else {}
+        if not inverse and self._unique(pred):
+            value = thing._rdf_to_python(pred, terms[0], types=containers.get(terms[0], ()))
+        else:
+            value = tuple(thing._rdf_to_python(pred, t, inverse=inverse, types=containers.get(t, ()))
+                          for t in terms)
+        self._values[key] = value
+        return value
+
+    def _container_types(self):
+        """
+        Read which of the URIs in the snapshot are rdf:Lists or rdf:Seqs, the
+        only types that change how a node converts, in one query for each
+        type rather than one per URI.
+
+        returns dict of URI to list of those types
+        """
+        if self._containers is None:
+            linked = set(t for terms in self._terms.values() for t in terms if isinstance(t, URI))
+            self._containers = {}
+            if linked:
+                view = self._thing._factory._view
+                for kind in (RDF.List, RDF.Seq):
+                    for subj in view.subjects(RDF.type, kind):
+                        if subj in linked:
+                            self._containers.setdefault(subj, []).append(kind)
+        return self._containers
+
+    def _unique(self, pred):
+        """
+        Figure out if a predicate has a cardinality of one for the Thing, from
+        the rdf:types in the scan rather than by reading them again.
+        """
+        schema = self._thing._factory.schema
+        return pred in schema.functional or \
+            not schema.restrictions.get(pred, frozenset()).isdisjoint(self._types)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
@@ -1,17 +1,27 @@
 # -*- coding: utf-8 -*-
 import pytest
-from laconia import ThingFactory
-from rdflib import Graph, URIRef, Literal, RDF, RDFS, OWL
+from laconia import ThingFactory, Thing, ResourceSet, CompactStore, SnapshotStore, TrackedStore, write_snapshot
+from rdflib import Graph, URIRef, Literal, BNode, RDF, RDFS, OWL, XSD
 from rdflib.compare import to_isomorphic
+try:
+    from rdflib.plugins.stores.memory import Memory
+except ImportError:
+    from rdflib.plugins.memory import IOMemory as Memory
+from rdflib.store import Store
 import logging
+import gc
+import io
+import json
+import os
+import sys
+import threading
 
 
 logging.basicConfig(level=logging.DEBUG)
 
 
-@pytest.fixture
-def store():
-    g = Graph()
+def _graph(store='default'):
+    g = Graph(store=store)
     g.bind("rf", "http://rossfenning.co.uk/#")
     g.bind("foaf", "http://xmlns.com/foaf/0.1/")
     g.bind("rdf", RDF)
@@ -19,6 +29,16 @@ def store():
     return g
 
 
+@pytest.fixture
+def store():
+    return _graph()
+
+
+@pytest.fixture
+def tracked_store():
+    return _graph(TrackedStore())
+
+
 @pytest.fixture
 def factory(store):
     return ThingFactory(store)
@@ -332,6 +352,42 @@ def test_filtering_for_one_language(factory):
     assert set(dog.rdfs_label) == {'Dog', 'Chien', 'Pooch', 'Mutt'}
 
 
+def test_membership_respects_language(factory):
+    dog = factory('rf_dog')
+    dog.rdfs_label.add('Dog', lang='en')
+    dog.rdfs_label.add('Chien', lang='fr')
+    dog.rdfs_label.add('Pooch')
+
+    dog.lang = 'fr'
+    assert len(dog.rdfs_label) == 2
+    assert 'Chien' in dog.rdfs_label
+    assert 'Pooch' in dog.rdfs_label
+    assert 'Dog' not in dog.rdfs_label
+    assert Literal('Dog', lang='en') not in dog.rdfs_label
+    assert Literal('Chien', lang='fr') in dog.rdfs_label
+
+    dog.rdfs_label.remove('Chien')
+    assert set(dog.rdfs_label) == {'Pooch'}
+    dog.lang = None
+    assert set(dog.rdfs_label) == {'Dog', 'Pooch'}
+
+
+def test_membership_in_a_language_leaves_other_datatypes_alone(factory):
+    me = factory('rf_me')
+    me.rf_n.add(5)
+    me.rf_n.add('five', lang='en')
+    assert '5' not in me.rf_n
+
+    me.lang = 'en'
+    assert '5' not in me.rf_n
+    assert 'five' in me.rf_n
+    me.rf_n.discard('5')
+    me.rf_n.discard('five')
+
+    me.lang = None
+    assert set(me.rf_n) == {5}
+
+
 def test_non_ascii(store):
     store.bind("schema", "http://schema.org/")
     store.parse('les-mis.ttl', format='turtle')
@@ -357,3 +413,1500 @@ def test_attribute_error_when_unknown_prefix_written(factory):
     mouse = factory('rf_mouse')
     with pytest.raises(AttributeError):
         mouse.unknown_attr = 'hello'
+
+
+def test_cardinality_restriction_on_subject_class_makes_property_unique(factory):
+    factory.store.bind('rdfs', RDFS)
+    restriction = factory(None,
+      rdf_type=[factory('owl_Restriction')],
+      owl_onProperty=[factory('rf_nickname')],
+    )
+    factory.store.add((restriction._id, OWL.maxCardinality, Literal('1')))
+    factory('rf_Person', rdfs_subClassOf=[restriction])
+
+    ross = factory('rf_me')
+    ross.rdf_type.add(factory('rf_Person'))
+    ross.rf_nickname = 'Ross'
+
+    assert ross.rf_nickname == 'Ross'
+
+
+def test_schema_index_is_shared_until_schema_changes(store):
+    factory = ThingFactory(store, compile_schema=True)
+    ross = factory('rf_me')
+    ross.rf_likes.add('Cheese')
+    schema = factory.schema
+
+    ross.rf_likes.add('Beer')
+    assert factory.schema is schema
+
+    factory('rf_likes', rdf_type=[factory('owl_FunctionalProperty')])
+    assert factory.schema is not schema
+    assert URIRef('http://rossfenning.co.uk/#likes') in factory.schema.functional
+
+
+def test_factory_leaves_its_graph_alone(store):
+    methods = dict(vars(store))
+    ThingFactory(store, cache=True)('rf_me').rf_likes.add('Cheese')
+
+    assert vars(store) == methods
+    assert not [name for (name, value) in vars(store.store).items() if callable(value)]
+
+
+def test_schema_written_to_store_needs_invalidating(store):
+    factory = ThingFactory(store, compile_schema=True)
+    ross = factory('rf_me')
+    ross.rf_likes.add('Cheese')
+    assert isinstance(ross.rf_likes, ResourceSet)
+
+    factory.store.add((URIRef('http://rossfenning.co.uk/#likes'), RDF.type, OWL.FunctionalProperty))
+    factory.invalidate_schema()
+
+    assert ross.rf_likes == 'Cheese'
+
+
+def test_schema_parsed_into_store_after_compiling_is_seen_once_invalidated(store):
+    factory = ThingFactory(store, compile_schema=True)
+    ross = factory('rf_me', foaf_gender=['male'])
+    assert isinstance(ross.foaf_gender, ResourceSet)
+
+    factory.store.parse(data='<http://xmlns.com/foaf/0.1/gender> a '
+                             '<http://www.w3.org/2002/07/owl#FunctionalProperty> .', format='turtle')
+    factory.invalidate_schema()
+
+    assert ross.foaf_gender == 'male'
+
+
+def test_schema_parsed_into_store_after_a_read_is_seen(factory):
+    ross = factory('rf_me', foaf_birthday=['01-01'])
+    assert isinstance(ross.foaf_birthday, ResourceSet)
+
+    factory.store.parse(data='<http://xmlns.com/foaf/0.1/birthday> a '
+                             '<http://www.w3.org/2002/07/owl#FunctionalProperty> .', format='turtle')
+
+    assert ross.foaf_birthday == '01-01'
+
+
+def test_reads_and_writes_do_not_measure_the_store(store):
+    class Unmeasured(Graph):
+        def __len__(self):
+            raise AssertionError('len() of the store was taken')
+
+    unmeasured = Unmeasured(store=store.store)
+    factory = ThingFactory(unmeasured)
+    ross = factory('rf_me', rf_name=['Ross'])
+    ross.rf_likes.add('Cheese')
+
+    assert 'Cheese' in ross.rf_likes
+    assert set(ross.rf_name) == {'Ross'}
+
+
+def test_writes_through_factory_do_not_recompile_schema(store):
+    factory = ThingFactory(store, compile_schema=True)
+    ross = factory('rf_me')
+    stats = factory.enable_stats()
+    for i in range(10):
+        ross.rf_likes.add('Thing %d' % i)
+        assert 'Thing %d' % i in ross.rf_likes
+
+    assert stats.snapshot()['cache_misses'].get('schema', 0) <= 1
+
+
+def test_invalidating_schema_recompiles_index(store):
+    factory = ThingFactory(store, compile_schema=True)
+    schema = factory.schema
+    factory.invalidate_schema()
+    assert factory.schema is not schema
+
+
+def test_attribute_resolves_once_prefix_bound_after_failed_lookup(factory):
+    mouse = factory('rf_mouse')
+    assert not hasattr(mouse, 'ex_squeak')
+
+    factory.store.bind('ex', 'http://example.com/#')
+    mouse.ex_squeak.add('eek')
+
+    assert (URIRef('http://rossfenning.co.uk/#mouse'),
+            URIRef('http://example.com/#squeak'),
+            Literal('eek')) in factory.store
+
+
+def test_attribute_resolves_once_prefix_bound_on_namespace_manager(factory):
+    mouse = factory('rf_mouse')
+    assert not hasattr(mouse, 'zz_squeak')
+
+    factory.store.namespace_manager.bind('zz', 'http://example.com/zz#')
+    mouse.zz_squeak.add('eek')
+
+    assert (URIRef('http://rossfenning.co.uk/#mouse'),
+            URIRef('http://example.com/zz#squeak'),
+            Literal('eek')) in factory.store
+
+
+def test_attribute_follows_prefix_rebound_to_another_namespace(factory):
+    ross = factory('rf_me', rf_likes=['Cheese'])
+    assert ross.to_dict() == {'@id': 'http://rossfenning.co.uk/#me', 'rf_likes': ['Cheese']}
+
+    factory.store.bind('rf', 'http://example.com/rf#', replace=True)
+
+    assert factory('rf_me')._id == URIRef('http://example.com/rf#me')
+    assert ross.to_dict() == {'@id': 'http://rossfenning.co.uk/#me',
+                              'http://rossfenning.co.uk/#likes': ['Cheese']}
+
+
+
+def test_attribute_read_through_a_thing_follows_prefix_rebound(factory):
+    factory.store.bind('ex', 'http://a.example/#')
+    ross = factory('rf_me')
+    ross.ex_name.add('one')
+
+    factory.store.bind('ex', 'http://b.example/#', replace=True)
+    ross.ex_name.add('two')
+
+    assert (ross._id, URIRef('http://a.example/#name'), Literal('one')) in factory.store
+    assert (ross._id, URIRef('http://b.example/#name'), Literal('two')) in factory.store
+
+
+def test_resolved_attributes_are_only_checked_against_their_prefix(factory, monkeypatch):
+    ross = factory('rf_me', rf_likes=['Cheese'])
+    resolved = []
+    lookup_uri = factory._lookup_uri
+    monkeypatch.setattr(factory, '_lookup_uri', lambda attr: resolved.append(attr) or lookup_uri(attr))
+
+    for _ in range(10):
+        assert set(ross.rf_likes) == {'Cheese'}
+        assert not hasattr(ross, 'ex_likes')
+    assert resolved == ['ex_likes']
+
+
+def test_resolved_names_are_bounded(factory, monkeypatch):
+    monkeypatch.setattr('laconia.NAME_CACHE_SIZE', 10)
+    for i in range(100):
+        factory('http://example.com/thing%d' % i)
+        factory('rf_thing%d' % i)
+
+    assert len(factory._uris) <= 10
+    assert not any(':' in attr for attr in factory._uris)
+
+
+def test_alias_overrides_previously_resolved_name(factory):
+    ross = factory('rf_me')
+    ross.rf_cheese.add('Brie')
+
+    factory.addAlias('rf_cheese', 'http://rossfenning.co.uk/#favourite-cheese')
+    ross.rf_cheese.add('Stilton')
+
+    assert (URIRef('http://rossfenning.co.uk/#me'),
+            URIRef('http://rossfenning.co.uk/#favourite-cheese'),
+            Literal('Stilton')) in factory.store
+
+
+def test_interning_factory_returns_same_thing_for_same_node(store):
+    factory = ThingFactory(store, intern=True)
+    ross = factory('rf_me')
+    ross.rf_likes.add(factory('rf_Cheese'))
+
+    assert factory('rf_me') is ross
+    assert list(ross.rf_likes)[0] is factory('rf_Cheese')
+    assert factory('rf_me') is not factory('rf_you')
+
+
+def test_interned_things_are_released_when_unused(store):
+    factory = ThingFactory(store, intern=True)
+    factory('rf_me')
+    gc.collect()
+    assert len(factory._things) == 0
+
+
+def test_interned_things_keep_lang_and_prefetched_values_to_themselves(store):
+    factory = ThingFactory(store, intern=True)
+    ross = factory('rf_me', rdfs_label=[Literal('Ross', lang='en'), Literal('Rosse', lang='fr')])
+    post = factory('rf_post', rf_tag=['rdf'])
+
+    ross.lang = 'fr'
+    factory.prefetch([post], ['rf_tag'])
+    store.add((post._id, URIRef('http://rossfenning.co.uk/#tag'), Literal('python')))
+
+    assert set(ross.rdfs_label) == {'Rosse'}
+    assert factory('rf_me') is not ross
+    assert factory('rf_me').lang is None
+    assert factory('rf_me') is factory('rf_me')
+    assert len(set(factory('rf_me').rdfs_label)) == 2
+    assert set(post.rf_tag) == {'rdf'}
+    assert set(factory('rf_post').rf_tag) == {'rdf', 'python'}
+
+
+def test_things_not_interned_by_default(factory):
+    assert factory('rf_me') is not factory('rf_me')
+
+
+def _store_rdf_list(store, items):
+    cells = [BNode() for _ in items]
+    for cell, item, rest in zip(cells, items, cells[1:] + [RDF.nil]):
+        store.add((cell, RDF.first, Literal(item)))
+        store.add((cell, RDF.rest, rest))
+    return cells
+
+
+def test_reading_long_list_property(factory):
+    factory("rf_todo",
+      rdfs_range=[factory('rdf_List')],
+      rdf_type=[factory('owl_FunctionalProperty')],
+    )
+    ross = factory('rf_me')
+    cells = _store_rdf_list(factory.store, list(range(5000)))
+    factory.store.add((ross._id, URIRef('http://rossfenning.co.uk/#todo'), cells[0]))
+
+    assert ross.rf_todo == list(range(5000))
+
+
+def test_reading_cyclic_list_property_raises_value_error(factory):
+    factory("rf_todo",
+      rdfs_range=[factory('rdf_List')],
+      rdf_type=[factory('owl_FunctionalProperty')],
+    )
+    ross = factory('rf_me')
+    cells = _store_rdf_list(factory.store, ['a', 'b', 'c'])
+    factory.store.add((ross._id, URIRef('http://rossfenning.co.uk/#todo'), cells[0]))
+    factory.store.remove((cells[-1], RDF.rest, RDF.nil))
+    factory.store.add((cells[-1], RDF.rest, cells[1]))
+
+    with pytest.raises(ValueError):
+        ross.rf_todo
+
+
+def test_streaming_members_of_sequence_property(factory):
+    factory("rf_todo",
+      rdfs_range=[factory('rdf_Seq')],
+      rdf_type=[factory('owl_FunctionalProperty')],
+    )
+    ross = factory('rf_me')
+    ross.rf_todo = ['a', 'b', 'c']
+
+    members = ross.members('rf_todo')
+    assert next(members) == 'a'
+    assert list(members) == ['b', 'c']
+
+
+def test_setting_long_list_property(factory):
+    factory("rf_todo",
+      rdfs_range=[factory('rdf_List')],
+      rdf_type=[factory('owl_FunctionalProperty')],
+    )
+
+    ross = factory('rf_me')
+    ross.rf_todo = list(range(5000))
+
+    assert ross.rf_todo == list(range(5000))
+
+
+def test_setting_empty_list_property(factory):
+    factory("rf_todo",
+      rdfs_range=[factory('rdf_List')],
+      rdf_type=[factory('owl_FunctionalProperty')],
+    )
+
+    ross = factory('rf_me')
+    ross.rf_todo = []
+
+    assert ross.rf_todo == []
+
+
+def test_relating_things_with_cyclic_data_in_different_stores(factory):
+    factory2 = ThingFactory(Graph())
+    factory2.store.bind('foaf', 'http://xmlns.com/foaf/0.1/')
+    alice, bob = factory2('http://example.com/alice'), factory2('http://example.com/bob')
+    alice.foaf_knows.add(bob)
+    bob.foaf_knows.add(alice)
+
+    ross = factory('rf_me')
+    ross.foaf_knows.add(alice)
+
+    assert bob in factory('http://example.com/alice').foaf_knows
+    assert alice in factory('http://example.com/bob').foaf_knows
+
+
+def test_copying_with_depth_limit(factory):
+    alice, bob, carol = factory('rf_alice'), factory('rf_bob'), factory('rf_carol')
+    alice.foaf_knows.add(bob)
+    bob.foaf_knows.add(carol)
+    carol.foaf_name.add('Carol')
+
+    target = Graph()
+    alice.copyTo(target, depth=1)
+
+    assert len(target) == 2
+    assert (bob._id, URIRef('http://xmlns.com/foaf/0.1/knows'), carol._id) in target
+
+
+def test_copying_concise_bounded_description(factory):
+    ross = factory('rf_me')
+    ross.foaf_knows.add(factory('rf_bob', foaf_name=['Bob']))
+    ross.rf_address.add(factory(None, rf_city=['Bristol']))
+
+    target = Graph()
+    ross.copyTo(target, bnodes_only=True)
+
+    assert len(target) == 3
+    assert (None, URIRef('http://rossfenning.co.uk/#city'), Literal('Bristol')) in target
+
+
+def test_copying_only_some_predicates(factory):
+    ross = factory('rf_me')
+    ross.foaf_knows.add(factory('rf_bob', foaf_name=['Bob'], rf_likes=['Cheese']))
+    ross.rf_likes.add('Beer')
+
+    target = Graph()
+    ross.copyTo(target, predicates=['foaf_knows', 'foaf_name'])
+
+    assert set(target.objects()) == {URIRef('http://rossfenning.co.uk/#bob'), Literal('Bob')}
+
+
+def test_length_and_truth_of_resource_set_respect_language(factory):
+    dog = factory('rf_dog')
+    dog.rdfs_label.add('Dog', lang='en')
+    dog.rdfs_label.add('Chien', lang='fr')
+
+    assert len(dog.rdfs_label) == 2
+    dog.lang = 'fr'
+    assert len(dog.rdfs_label) == 1
+    dog.lang = 'de'
+    assert len(dog.rdfs_label) == 0
+    assert not dog.rdfs_label
+
+
+def test_first_converts_only_one_member(factory, monkeypatch):
+    ross = factory('rf_me')
+    for food in ['Beer', 'Cheese', 'Pickles']:
+        ross.rf_likes.add(factory('rf_' + food))
+
+    converted = []
+    original = ross._rdf_to_python
+    def counting_rdf_to_python(*args, **kwargs):
+        converted.append(args)
+        return original(*args, **kwargs)
+    monkeypatch.setattr(ross, '_rdf_to_python', counting_rdf_to_python)
+
+    assert ross.rf_likes.first() in {factory('rf_Beer'), factory('rf_Cheese'), factory('rf_Pickles')}
+    assert ross.rf_likes
+    assert len(converted) == 1
+    assert ross.rf_dislikes.first('nothing') == 'nothing'
+
+
+def test_prefetched_properties_are_read_without_the_store(factory):
+    blog = factory('rf_blog')
+    for title in ['One', 'Two']:
+        blog.rf_items.add(factory(None, rf_title=[title], rf_author=['Ross']))
+
+    items = blog.rf_items.prefetch(['rf_title'])
+    factory.store.remove((None, URIRef('http://rossfenning.co.uk/#title'), None))
+    factory.store.remove((None, URIRef('http://rossfenning.co.uk/#author'), None))
+
+    assert {title for item in items for title in item.rf_title} == {'One', 'Two'}
+    assert [len(item.rf_author) for item in items] == [0, 0]
+
+
+def test_prefetching_few_things_reads_only_their_values(store, monkeypatch):
+    factory = ThingFactory(store, compile_schema=True)
+    things = [factory('rf_item%d' % i, rf_title=['Item %d' % i]) for i in range(10)]
+    stats = factory.enable_stats()
+
+    factory.prefetch(things[:2], ['rf_title'])
+    assert stats.snapshot()['store_calls'] == {'SP?': 2}
+    assert [list(thing.rf_title) for thing in things[:2]] == [['Item 0'], ['Item 1']]
+
+    pytest.importorskip('numpy')
+    monkeypatch.setattr('laconia.SCAN_SUBJECTS', 1)
+    stats.reset()
+    assert list(factory.column(things[:2], 'rf_title')) == ['Item 0', 'Item 1']
+    assert stats.snapshot()['store_calls'] == {'?P?': 1}
+
+
+class _RemoteStore(Store):
+    """
+    Stands in for a store where each lookup is a round trip, such as a SQL
+    database, recording the patterns it is asked about.
+    """
+    def __init__(self):
+        Store.__init__(self)
+        self._memory = Memory()
+        self.patterns = []
+
+    def add(self, triple, context, quoted=False):
+        self._memory.add(triple, context, quoted)
+
+    def triples(self, pattern, context=None):
+        self.patterns.append(pattern)
+        return self._memory.triples(pattern, context)
+
+    def __len__(self, context=None):
+        return len(self._memory)
+
+    def bind(self, prefix, namespace, override=True):
+        try:
+            self._memory.bind(prefix, namespace, override=override)
+        except TypeError:
+            self._memory.bind(prefix, namespace)
+
+    def namespace(self, prefix):
+        return self._memory.namespace(prefix)
+
+    def prefix(self, namespace):
+        return self._memory.prefix(namespace)
+
+    def namespaces(self):
+        return self._memory.namespaces()
+
+
+def test_prefetching_from_a_remote_store_reads_each_property_once():
+    graph = Graph(store=_RemoteStore())
+    graph.bind('rss', 'http://purl.org/rss/1.0/')
+    factory = ThingFactory(graph, compile_schema=True)
+    items = [factory(None, rss_title=['Item %d' % i], rss_description=['About %d' % i])
+             for i in range(20)]
+    del graph.store.patterns[:]
+
+    factory.prefetch(items, ['rss_title', 'rss_description'])
+
+    assert [s for (s, _, _) in graph.store.patterns] == [None, None]
+    assert [list(item.rss_title) for item in items[:2]] == [['Item 0'], ['Item 1']]
+    assert len(graph.store.patterns) == 2
+
+
+def test_prefetched_values_can_be_dropped(store):
+    factory = ThingFactory(store, intern=True)
+    factory('rf_title', rdf_type=[factory('owl_FunctionalProperty')])
+    post = factory('rf_post', rf_title='Draft', rf_tag=['rdf'])
+    factory.prefetch([post], ['rf_title', 'rf_tag'])
+    store.set((post._id, URIRef('http://rossfenning.co.uk/#title'), Literal('Final')))
+    store.add((post._id, URIRef('http://rossfenning.co.uk/#tag'), Literal('python')))
+
+    factory.invalidate_prefetched([post], ['rf_title'])
+    assert post.rf_title == 'Final'
+    assert set(post.rf_tag) == {'rdf'}
+
+    factory.invalidate_prefetched([post])
+    assert set(post.rf_tag) == {'rdf', 'python'}
+
+
+def test_writes_through_thing_replace_prefetched_values(factory):
+    factory('rf_title', rdf_type=[factory('owl_FunctionalProperty')])
+    post = factory('rf_post', rf_title='Draft', rf_tag=['rdf'])
+    factory.prefetch([post], ['rf_title', 'rf_tag'])
+
+    post.rf_title = 'Final'
+    post.rf_tag.add('python')
+
+    assert post.rf_title == 'Final'
+    assert set(post.rf_tag) == {'rdf', 'python'}
+
+
+def test_batch_buffers_writes_until_block_exits(factory):
+    ross = factory('rf_me')
+    with factory.batch():
+        ross.rf_likes.add('Beer')
+        ross.rf_likes.add('Cheese')
+        assert len(factory.store) == 0
+        assert set(ross.rf_likes) == {'Beer', 'Cheese'}
+
+    assert set(ross.rf_likes) == {'Beer', 'Cheese'}
+    assert len(factory.store) == 2
+
+
+def test_batch_collapses_writes_that_cancel_out(factory):
+    factory('rf_mood', rdf_type=[factory('owl_FunctionalProperty')])
+    ross = factory('rf_me', rf_mood='happy')
+
+    with factory.batch():
+        ross.rf_mood = 'sad'
+        ross.rf_mood = 'happy'
+        ross.rf_likes.add('Beer')
+        ross.rf_likes.discard('Beer')
+        assert ross.rf_mood == 'happy'
+        assert 'Beer' not in ross.rf_likes
+
+    assert ross.rf_mood == 'happy'
+    assert set(ross.rf_likes) == set()
+
+
+def test_batch_discards_writes_when_block_raises(factory):
+    ross = factory('rf_me')
+    with pytest.raises(ValueError):
+        with factory.batch():
+            ross.rf_likes.add('Beer')
+            raise ValueError
+
+    assert len(factory.store) == 0
+
+
+def test_batch_discards_things_copied_from_another_store(factory):
+    ross = factory('rf_me')
+    cheese = ThingFactory(Graph())('http://dbpedia.org/Cheese')
+    cheese.rdfs_label.add('Cheese')
+
+    with pytest.raises(ValueError):
+        with factory.batch():
+            ross.rf_likes.add(cheese)
+            assert (cheese._id, RDFS.label, Literal('Cheese')) in factory._view
+            raise ValueError
+
+    assert len(factory.store) == 0
+
+
+@pytest.mark.parametrize('compile_schema', [False, True])
+def test_schema_written_in_batch_applies_inside_it(store, compile_schema):
+    factory = ThingFactory(store, compile_schema=compile_schema)
+    ross = factory('rf_me')
+    with factory.batch():
+        factory('rf_mood', rdf_type=[factory('owl_FunctionalProperty')])
+        ross.rf_mood = 'happy'
+        assert ross.rf_mood == 'happy'
+    assert ross.rf_mood == 'happy'
+
+
+
+def test_batch_without_schema_writes_keeps_the_compiled_schema(store):
+    factory = ThingFactory(store, compile_schema=True)
+    factory('rf_mood', rdf_type=[factory('owl_FunctionalProperty')])
+    ross = factory('rf_me', rf_mood='happy')
+    compiled = factory.schema
+    with factory.batch():
+        ross.rf_mood = 'sad'
+        ross.rf_likes.add('Cheese')
+        assert factory.schema is compiled
+    assert factory.schema is compiled
+
+def test_creating_many_things_writes_once(factory, monkeypatch):
+    factory('rf_age', rdf_type=[factory('owl_FunctionalProperty')])
+    writes = []
+    for name in ('add', 'addN', 'remove'):
+        method = getattr(factory.store, name)
+        monkeypatch.setattr(factory.store, name, lambda arg, method=method: writes.append(method(arg)))
+
+    people = factory.create_many([
+        {'foaf_name': ['Alice'], 'rf_age': 30},
+        ('rf_bob', {'foaf_name': {'Bob', 'Robert'}, 'rf_age': 40}),
+    ])
+
+    assert len(writes) == 1
+    alice, bob = list(people)
+    assert set(alice.foaf_name) == {'Alice'}
+    assert alice.rf_age == 30
+    assert bob == factory('rf_bob')
+    assert set(bob.foaf_name) == {'Bob', 'Robert'}
+    assert bob.rf_age == 40
+
+
+def test_creating_many_things_resolves_each_name_once(factory, monkeypatch):
+    restriction = factory(None, rdf_type=[factory('owl_Restriction')],
+                          owl_onProperty=[factory('rf_age')])
+    restriction.owl_maxCardinality.add('1')
+    person = factory('rf_Person', rdfs_subClassOf=[restriction])
+    resolved = []
+    attr_to_uri = factory._attr_to_uri
+    monkeypatch.setattr(factory, '_attr_to_uri',
+                        lambda attr: resolved.append(attr) or attr_to_uri(attr))
+
+    people = list(factory.create_many(
+        {'rdf_type': [person], 'rf_age': age} for age in range(5)))
+
+    assert sorted(resolved) == ['rdf_type', 'rf_age']
+    assert [person.rf_age for person in people] == list(range(5))
+
+
+def test_creating_many_things_replaces_unique_values_of_existing_things(factory):
+    factory('rf_age', rdf_type=[factory('owl_FunctionalProperty')])
+    factory('rf_bob', rf_age=39)
+
+    bob, = factory.create_many([('rf_bob', {'rf_age': 40})])
+
+    assert bob.rf_age == 40
+    assert len(list(factory.store.objects(bob._id, URIRef('http://rossfenning.co.uk/#age')))) == 1
+
+
+def test_creating_many_things_rejects_single_value_for_multi_valued_property(factory):
+    with pytest.raises(TypeError):
+        factory.create_many([{'foaf_name': 'Alice'}])
+
+
+def test_following_path_of_properties(factory):
+    ross = factory('rf_me')
+    for name in ['Alice', 'Bob']:
+        friend = factory('rf_' + name.lower(), foaf_name=[name])
+        ross.foaf_knows.add(friend)
+        friend.foaf_knows.add(ross)
+
+    assert set(ross.path('foaf_knows/foaf_name')) == {'Alice', 'Bob'}
+    assert set(ross.path(['foaf_knows', 'foaf_knows_of'])) == {ross}
+
+
+def test_following_path_with_repeated_step(factory):
+    a, b, c = factory('rf_a'), factory('rf_b', rdfs_label=['B']), factory('rf_c', rdfs_label=['C'])
+    a.rf_next.add(b)
+    b.rf_next.add(c)
+    c.rf_next.add(a)
+
+    assert set(a.path('rf_next+/rdfs_label')) == {'B', 'C'}
+    assert set(a.path('rf_next*')) == {a, b, c}
+
+
+def test_following_path_respects_language(factory):
+    ross = factory('rf_me')
+    dog = factory('rf_dog')
+    ross.rf_owns.add(dog)
+    dog.rdfs_label.add('Dog', lang='en')
+    dog.rdfs_label.add('Chien', lang='fr')
+
+    ross.lang = 'fr'
+    assert list(ross.path('rf_owns/rdfs_label')) == ['Chien']
+
+
+def test_finding_things_by_property_values(store):
+    store.parse('foaf.rdf')
+    factory = ThingFactory(store)
+    person = factory('foaf_Person')
+    factory('rf_alice', rdf_type=[person], foaf_gender='female')
+    factory('rf_bob', rdf_type=[person], foaf_gender='male')
+    factory('rf_carl', rdf_type=[person], foaf_gender='male')
+    factory('rf_dog', foaf_gender='male')
+
+    assert set(factory.where(rdf_type=person, foaf_gender='male')) == \
+        {factory('rf_bob'), factory('rf_carl')}
+    assert list(factory.where(rdf_type=person, foaf_gender='robot')) == []
+
+
+def test_finding_things_with_limit_and_offset(factory):
+    for i in range(10):
+        factory('rf_thing%d' % i, rf_colour=['red'])
+
+    everything = list(factory.where(rf_colour='red'))
+    assert len(everything) == 10
+    assert list(factory.where(rf_colour='red', limit=3, offset=2)) == everything[2:5]
+
+
+
+def test_finding_things_counts_no_condition_in_full(factory, monkeypatch):
+    factory.store.addN((URIRef('http://rossfenning.co.uk/#thing%d' % i),
+                        URIRef('http://rossfenning.co.uk/#colour'), Literal('red'), factory.store)
+                       for i in range(5000))
+    factory('rf_thing7', rf_shape=['round'])
+    pulled = []
+    subjects = factory.store.subjects
+
+    def counting(*args):
+        for subj in subjects(*args):
+            pulled.append(subj)
+            yield subj
+    monkeypatch.setattr(factory.store, 'subjects', counting)
+
+    assert list(factory.where(rf_colour='red', rf_shape='round')) == [factory('rf_thing7')]
+    assert len(pulled) < 1000
+
+def test_finding_things_needs_a_condition(factory):
+    with pytest.raises(TypeError):
+        factory.where()
+
+
+def test_extracting_column_of_values_as_array(factory):
+    numpy = pytest.importorskip('numpy')
+    factory.store.bind('xsd', 'http://www.w3.org/2001/XMLSchema#')
+    factory('rf_age', rdf_type=[factory('owl_FunctionalProperty')], rdfs_range=[factory('xsd_int')])
+    people = [factory('rf_alice', rf_age=30), factory('rf_bob'), factory('rf_carl', rf_age=50)]
+    people.append(factory('rf_dave'))
+    factory.store.add((people[3]._id, URIRef('http://rossfenning.co.uk/#age'),
+                       Literal('old', datatype=URIRef('http://www.w3.org/2001/XMLSchema#int'))))
+
+    ages = factory.column(people, 'rf_age')
+
+    assert ages.dtype == numpy.int64
+    assert list(ages.mask) == [False, True, False, True]
+    assert ages.sum() == 80
+
+
+def test_resource_set_to_array(factory):
+    numpy = pytest.importorskip('numpy')
+    ross = factory('rf_me')
+    for score in [1.5, 2.5, 3.0]:
+        ross.rf_score.add(score)
+
+    scores = ross.rf_score.to_array()
+
+    assert scores.dtype == numpy.float64
+    assert sorted(scores) == [1.5, 2.5, 3.0]
+
+
+def test_tabulating_properties_of_many_things(factory):
+    factory('rf_age', rdf_type=[factory('owl_FunctionalProperty')])
+    alice = factory('rf_alice', rf_age=30, rf_likes=['Cheese', 'Beer'])
+    bob = factory('rf_bob', rf_likes=['Wine'])
+    bob.rdfs_label.add('Robert', lang='en')
+    bob.rdfs_label.add('Roberto', lang='it')
+
+    columns = factory.to_columns([alice, bob], ['rf_age', 'rf_likes', 'rdfs_label'], multi='count')
+    assert list(columns.items()) == [('rf_age', [1, 0]), ('rf_likes', [2, 1]), ('rdfs_label', [0, 2])]
+
+    columns = factory.to_columns([alice, bob], ['rf_age', 'rdfs_label'], lang='it')
+    assert columns == {'rf_age': [30, None], 'rdfs_label': [None, 'Roberto']}
+
+    columns = factory.to_columns([alice, bob], ['rf_likes'], multi='list')
+    assert [set(likes) for likes in columns['rf_likes']] == [{'Cheese', 'Beer'}, {'Wine'}]
+
+
+def test_tabulating_properties_as_arrays(factory):
+    pytest.importorskip('numpy')
+    alice = factory('rf_alice', rf_score=[3])
+    bob = factory('rf_bob')
+
+    columns = factory.to_columns([alice, bob], ['rf_score'], arrays=True)
+
+    assert list(columns['rf_score'].mask) == [False, True]
+    assert columns['rf_score'][0] == 3
+
+
+def test_factory_loads_compiled_schema(store, tmp_path):
+    store.parse('foaf.rdf')
+    factory = ThingFactory(store)
+    factory.addAlias('nick', 'http://xmlns.com/foaf/0.1/nick')
+    path = str(tmp_path / 'foaf.schema')
+    factory.save_schema(path)
+
+    factory = ThingFactory(Graph(), schema=path)
+    ross = factory('http://rossfenning.co.uk/#me', foaf_gender='male')
+    ross.nick.add('avengerpenguin')
+
+    assert str(ross.foaf_gender) == 'male'
+    assert set(ross.nick) == {'avengerpenguin'}
+    assert factory.schema.functional == ThingFactory(store, compile_schema=True).schema.functional
+
+
+def test_compiled_schema_is_json_and_keeps_existing_prefixes(store, tmp_path):
+    store.bind('ex', 'http://example.com/old#')
+    path = str(tmp_path / 'foaf.schema')
+    ThingFactory(store).save_schema(path)
+    with open(path) as f:
+        assert json.load(f)['format'] == 'laconia-schema-1'
+
+    target = Graph()
+    target.bind('ex', 'http://example.com/new#')
+    factory = ThingFactory(target, schema=path)
+
+    assert factory('ex_thing')._id == URIRef('http://example.com/new#thing')
+    assert factory('rf_me')._id == URIRef('http://rossfenning.co.uk/#me')
+
+
+def test_compact_store_backs_a_factory():
+    store = Graph(store=CompactStore())
+    store.bind("rf", "http://rossfenning.co.uk/#")
+    factory = ThingFactory(store)
+    ross = factory('rf_me', rf_likes=['Cheese', 'Beer'])
+    ross.rf_likes.remove('Beer')
+
+    assert set(factory('rf_me').rf_likes) == {'Cheese'}
+    assert len(store) == 1
+
+
+def test_compact_store_loads_ntriples(tmp_path):
+    path = tmp_path / 'data.nt'
+    path.write_bytes(b'<http://example.com/a> <http://example.com/p> "x" .\n'
+                     b'<http://example.com/a> <http://example.com/p> <http://example.com/b> .\n'
+                     b'<http://example.com/a> <http://example.com/p> "x" .\n')
+    store = CompactStore()
+    store.load(str(path))
+    graph = Graph(store=store)
+
+    assert len(graph) == 2
+    assert set(graph.objects(URIRef('http://example.com/a'), URIRef('http://example.com/p'))) == \
+        {Literal('x'), URIRef('http://example.com/b')}
+    assert list(graph.subjects(None, URIRef('http://example.com/b'))) == [URIRef('http://example.com/a')]
+
+
+def test_compact_store_merges_writes(monkeypatch):
+    monkeypatch.setattr('laconia.COMPACT_MIN_DELTA', 2)
+    store = Graph(store=CompactStore())
+    reference = Graph()
+    p = URIRef('http://example.com/p')
+    for i in range(20):
+        triple = (URIRef('http://example.com/s%d' % (i % 3)), p, Literal(i))
+        store.add(triple)
+        reference.add(triple)
+    for i in range(0, 20, 4):
+        store.remove((None, p, Literal(i)))
+        reference.remove((None, p, Literal(i)))
+
+    assert len(store.store._added) < 20
+    assert set(store) == set(reference)
+    assert set(store.objects(URIRef('http://example.com/s1'), p)) == \
+        set(reference.objects(URIRef('http://example.com/s1'), p))
+
+
+def test_factory_navigates_snapshot(store, tmp_path):
+    factory = ThingFactory(store)
+    ross = factory('rf_me', foaf_name=['Ross'], rf_likes=['Cheese', Literal(u'Bière', lang='fr')])
+    ross.foaf_knows.add(factory('rf_alice', foaf_name=['Alice']))
+    path = str(tmp_path / 'data.snapshot')
+    write_snapshot(store, path)
+
+    snapshot = Graph(store=SnapshotStore(path))
+    factory = ThingFactory(snapshot)
+    ross = factory('rf_me')
+
+    assert len(snapshot) == len(store)
+    assert set(snapshot) == set(store)
+    assert set(ross.rf_likes) == {'Cheese', u'Bière'}
+    assert [str(friend.foaf_name.first()) for friend in ross.foaf_knows] == ['Alice']
+    assert list(snapshot.objects(URIRef('http://rossfenning.co.uk/#nobody'))) == []
+
+
+def test_snapshot_is_read_only(store, tmp_path):
+    path = str(tmp_path / 'data.snapshot')
+    write_snapshot(store, path)
+    snapshot = Graph(store=SnapshotStore(path))
+
+    with pytest.raises(TypeError):
+        snapshot.add((URIRef('http://example.com/a'), RDF.type, OWL.Thing))
+    assert len(snapshot) == 0
+    assert snapshot.store.namespace('rf') == URIRef('http://rossfenning.co.uk/#')
+
+
+def test_snapshot_closes_while_iterating(store, tmp_path):
+    store.parse('foaf.rdf')
+    path = str(tmp_path / 'data.snapshot')
+    write_snapshot(store, path)
+    snapshot = SnapshotStore(path)
+    triples = snapshot.triples((None, None, None))
+    first = next(triples)
+
+    snapshot.close()
+
+    assert 1 + sum(1 for _ in triples) == len(store)
+    assert first[0] in store
+
+
+def test_benchmarks_run(tmp_path):
+    bench_laconia = pytest.importorskip('bench_laconia')
+    results = bench_laconia.run([240], repeat=1, ops=3)
+    path = str(tmp_path / 'baseline.json')
+    bench_laconia.save(results, path)
+
+    rows, regressions = bench_laconia.compare(results, path)
+
+    assert set(results) == set(name for (name, _, _) in bench_laconia.BENCHMARKS)
+    assert len(rows) == len(results)
+    assert regressions == []
+
+
+def test_benchmark_schema_restricts_cardinality():
+    bench_laconia = pytest.importorskip('bench_laconia')
+    factory = ThingFactory(bench_laconia.generate_graph(24), bench_laconia.generate_schema())
+
+    assert isinstance(factory(bench_laconia.BENCH.person0).bench_age, int)
+
+
+def test_benchmark_saves_missing_baseline(tmp_path, capsys):
+    bench_laconia = pytest.importorskip('bench_laconia')
+    path = str(tmp_path / 'baseline.json')
+    argv = ['--sizes', '24', '--repeat', '1', '--ops', '2', '--only', 'getattr_functional',
+            '--compare', path, '--tolerance', '1e9']
+
+    assert bench_laconia.main(argv) == 0
+    assert os.path.exists(path)
+    assert 'saved these results' in capsys.readouterr().out
+
+    assert bench_laconia.main(argv) == 0
+    compared = [line for line in capsys.readouterr().out.splitlines() if '->' in line]
+    assert [line.split()[:2] for line in compared] == [['getattr_functional', '24']]
+
+
+def test_stats_count_store_calls_and_caches(store):
+    factory = ThingFactory(store, compile_schema=True)
+    factory('foaf_name', rdf_type=[factory('owl_FunctionalProperty')])
+    ross = factory('rf_me', foaf_name='Ross')
+    events = []
+    stats = factory.enable_stats(hook=lambda kind, name, value: events.append((kind, name)))
+
+    assert ross.foaf_name == 'Ross'
+    assert ross.foaf_name == 'Ross'
+    snapshot = stats.snapshot()
+
+    assert snapshot['store_calls']['SP?'] == 2
+    assert snapshot['cardinality_checks']['functional'] == 2
+    assert snapshot['cache_hits']['attr_to_uri'] == 2
+    assert snapshot['timings']['_isUniqueObject']['calls'] == 2
+    assert snapshot['timings']['_rdf_to_python']['seconds'] > 0
+    assert ('store_calls', 'SP?') in events
+
+
+def test_stats_are_off_by_default(factory):
+    ross = factory('rf_me', rf_likes=['Cheese'])
+    assert factory.stats is None
+
+    factory.enable_stats()
+    with factory.batch():
+        ross.rf_likes.add('Beer')
+    factory.disable_stats()
+    ross.rf_likes.add('Wine')
+
+    gc.collect()
+
+    assert factory.stats is None
+    assert factory._view is factory.store
+    assert set(ross.rf_likes) == {'Cheese', 'Beer', 'Wine'}
+
+
+def test_stats_count_a_batch_as_the_writes_it_flushes(factory):
+    ross = factory('rf_me', rf_likes=['Tea'])
+    stats = factory.enable_stats()
+
+    with factory.batch():
+        for i in range(100):
+            ross.rf_likes.add('Thing %d' % i)
+        ross.rf_likes.discard('Tea')
+
+    assert stats.snapshot()['store_writes'] == {'addN': 1, 'remove': 1}
+
+
+def test_stats_of_one_factory_leave_others_and_thing_alone(store):
+    methods = dict(vars(Thing))
+    timed, untimed = ThingFactory(store), ThingFactory(_graph())
+    stats = timed.enable_stats()
+
+    untimed('rf_me', rf_likes=['Cheese']).rf_likes.add('Beer')
+
+    assert stats.snapshot()['timings'] == {}
+    assert vars(Thing) == methods
+
+
+def _run_switching_often(threads):
+    """
+    Run threads to completion, switching between them as often as the
+    interpreter allows, to bring out races.
+    """
+    if hasattr(sys, 'setswitchinterval'):
+        get, set, often = sys.getswitchinterval, sys.setswitchinterval, 1e-6
+    else:
+        get, set, often = sys.getcheckinterval, sys.setcheckinterval, 10
+    interval = get()
+    set(often)
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        set(interval)
+
+
+def test_threadsafe_factory_replaces_values_atomically(store):
+    factory = ThingFactory(store, threadsafe=True)
+    factory('foaf_name', rdf_type=[factory('owl_FunctionalProperty')])
+    ross = factory('rf_me', foaf_name='0', rf_likes=[str(i) for i in range(50)])
+    errors, seen = [], set()
+
+    def write():
+        try:
+            for i in range(200):
+                ross.foaf_name = str(i)
+                ross.rf_likes.add('extra %d' % i)
+        except Exception as e:
+            errors.append(e)
+
+    def read():
+        try:
+            for _ in range(200):
+                names = list(factory._view.objects(ross._id, URIRef('http://xmlns.com/foaf/0.1/name')))
+                seen.add(len(names))
+                ross.foaf_name
+                list(ross.rf_likes)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write)] + [threading.Thread(target=read) for _ in range(3)]
+    _run_switching_often(threads)
+
+    assert errors == []
+    assert seen == {1}
+    assert ross.foaf_name == '199'
+    assert len(ross.rf_likes) == 250
+
+
+def test_threadsafe_factory_shares_name_caches_between_threads(store):
+    for i in range(2000):
+        store.bind('p%d' % i, 'http://example.com/p%d#' % i)
+    factory = ThingFactory(store, threadsafe=True)
+    ross = factory('rf_me')
+    errors = []
+
+    def run(work):
+        try:
+            for i in range(2000):
+                work(i)
+        except Exception as e:
+            errors.append(e)
+
+    def alias(i):
+        if i % 200 == 0:
+            factory.addAlias('alias%d' % i, 'http://example.com/alias#%d' % i)
+
+    workers = [lambda i: factory('rf_thing%d' % i),
+               lambda i: getattr(ross, 'p%d_foo' % i),
+               lambda i: factory._names_of(URIRef('http://example.com/p%d#foo' % i)),
+               alias]
+    threads = [threading.Thread(target=run, args=(work,)) for work in workers]
+    _run_switching_often(threads)
+
+    assert errors == []
+    assert factory._names_of(URIRef('http://example.com/p7#foo')) == ('p7_foo', 'p7:foo')
+
+
+def test_threadsafe_factory_batches_per_thread(store):
+    factory = ThingFactory(store, threadsafe=True)
+    ross = factory('rf_me')
+    inside = threading.Event()
+    done = threading.Event()
+    seen = []
+
+    def other():
+        inside.wait()
+        ross.rf_likes.add('Wine')
+        seen.append(set(ross.rf_likes))
+        done.set()
+
+    thread = threading.Thread(target=other)
+    thread.start()
+    with factory.batch():
+        ross.rf_likes.add('Cheese')
+        inside.set()
+        done.wait()
+        assert set(ross.rf_likes) == {'Cheese', 'Wine'}
+    thread.join()
+
+    assert seen == [{'Wine'}]
+    assert set(ross.rf_likes) == {'Cheese', 'Wine'}
+
+
+def test_threadsafe_reads_stop_early_and_see_the_threads_batch(store, monkeypatch):
+    monkeypatch.setattr('laconia.LOCKED_READ_CHUNK', 10)
+    factory = ThingFactory(store, threadsafe=True)
+    ross = factory('rf_me', rf_likes=['Thing %d' % i for i in range(100)])
+    pulled = []
+    objects = store.objects
+
+    def counting(*args):
+        for obj in objects(*args):
+            pulled.append(obj)
+            yield obj
+    monkeypatch.setattr(store, 'objects', counting)
+
+    assert ross.rf_likes.first() is not None
+    assert ross.rf_likes
+    assert len(pulled) == 20
+    assert len(ross.rf_likes) == 100
+    with factory.batch():
+        ross.rf_likes.add('More')
+        assert len(factory._view) == len(store) + 1
+
+
+
+def test_threadsafe_reads_finish_while_another_thread_writes(store, monkeypatch):
+    monkeypatch.setattr('laconia.LOCKED_READ_CHUNK', 10)
+    factory = ThingFactory(store, threadsafe=True)
+    ross = factory('rf_me', rf_likes=['Thing %d' % i for i in range(100)])
+    other = factory('rf_other')
+    pulled = []
+    objects = store.objects
+
+    def counting(*args):
+        for obj in objects(*args):
+            pulled.append(obj)
+            yield obj
+    monkeypatch.setattr(store, 'objects', counting)
+
+    seen = []
+    for like in ross.rf_likes:
+        seen.append(like)
+        writer = threading.Thread(target=other.rf_likes.add, args=('Like %d' % len(seen),))
+        writer.start()
+        writer.join()
+
+    assert sorted(seen) == sorted('Thing %d' % i for i in range(100))
+    assert len(pulled) == 100
+    assert not factory._lock._pending
+
+
+def test_threadsafe_reads_give_each_result_once_while_another_thread_removes(store, monkeypatch):
+    monkeypatch.setattr('laconia.LOCKED_READ_CHUNK', 10)
+    factory = ThingFactory(store, threadsafe=True)
+    ross = factory('rf_me', rf_likes=['Thing %d' % i for i in range(100)])
+
+    seen = []
+    for like in ross.rf_likes:
+        seen.append(like)
+        if len(seen) == 15:
+            writer = threading.Thread(target=lambda: [ross.rf_likes.discard(s) for s in seen[:2]])
+            writer.start()
+            writer.join()
+
+    assert sorted(seen) == sorted('Thing %d' % i for i in range(100))
+
+def _describe(thing):
+    return (str(thing._id), thing.foaf_name, sorted(thing.rf_likes), os.getpid())
+
+
+def test_mapping_over_subjects_in_worker_processes(store):
+    factory = ThingFactory(store)
+    factory('foaf_name', rdf_type=[factory('owl_FunctionalProperty')])
+    people = [factory('rf_person%d' % i, foaf_name='Person %d' % i, rf_likes=[str(i)])
+              for i in range(40)]
+
+    results = list(factory.map(_describe, people, workers=2, chunksize=5))
+
+    assert [r[:3] for r in results] == \
+        [(str(p._id), 'Person %d' % i, [str(i)]) for (i, p) in enumerate(people)]
+    assert os.getpid() not in set(r[3] for r in results)
+
+
+def test_mapping_from_several_threads_at_once_keeps_each_store():
+    factories = []
+    for n in range(3):
+        factory = ThingFactory(_graph())
+        factory('foaf_name', rdf_type=[factory('owl_FunctionalProperty')])
+        for i in range(20):
+            factory('rf_person%d' % i, foaf_name='Store %d' % n)
+        factories.append(factory)
+    results, errors = {}, []
+
+    def run(n):
+        try:
+            results[n] = [r[1] for r in factories[n].map(
+                _describe, ['rf_person%d' % i for i in range(20)], workers=2, chunksize=2)]
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(n,)) for n in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert results == dict((n, ['Store %d' % n] * 20) for n in range(3))
+
+
+def test_mapping_over_a_snapshot_unordered(store, tmp_path):
+    factory = ThingFactory(store)
+    factory('foaf_name', rdf_type=[factory('owl_FunctionalProperty')])
+    for i in range(10):
+        factory('rf_person%d' % i, foaf_name='Person %d' % i, rf_likes=[str(i)])
+    path = str(tmp_path / 'data.snapshot')
+    write_snapshot(store, path)
+    factory = ThingFactory(Graph(store=SnapshotStore(path)))
+
+    results = factory.map(_describe, ['rf_person%d' % i for i in range(10)], workers=3,
+                          ordered=False, chunksize=2)
+
+    assert sorted(r[1] for r in results) == sorted('Person %d' % i for i in range(10))
+
+
+def test_streaming_things_from_ntriples(factory):
+    factory('foaf_name', rdf_type=[factory('owl_FunctionalProperty')])
+    lines = []
+    for i in range(2000):
+        lines.append('<http://rossfenning.co.uk/#p%d> <http://xmlns.com/foaf/0.1/name> "Person %d" .' % (i, i))
+        lines.append('<http://rossfenning.co.uk/#p%d> <http://rossfenning.co.uk/#likes> "a" .' % i)
+        lines.append('<http://rossfenning.co.uk/#p%d> <http://rossfenning.co.uk/#likes> "b" .' % i)
+    f = io.BytesIO('\n'.join(lines).encode('utf-8'))
+
+    things = factory.stream(f)
+    first = next(things)
+
+    assert first.foaf_name == 'Person 0'
+    assert set(first.rf_likes) == {'a', 'b'}
+    assert f.tell() < len(f.getvalue())
+    assert [thing.foaf_name for thing in things][-1] == 'Person 1999'
+
+
+def test_streaming_things_from_nquads(factory, tmp_path):
+    path = tmp_path / 'data.nq'
+    path.write_bytes(
+        b'<http://rossfenning.co.uk/#a> <http://rossfenning.co.uk/#likes> "x" <http://example.com/g> .\n'
+        b'<http://rossfenning.co.uk/#a> <http://rossfenning.co.uk/#likes> "y" .\n'
+        b'_:b <http://rossfenning.co.uk/#likes> "z" <http://example.com/g> .\n')
+
+    things = [(thing._id, set(thing.rf_likes)) for thing in factory.stream(str(path), format='nquads')]
+
+    assert things[0] == (URIRef('http://rossfenning.co.uk/#a'), {'x', 'y'})
+    assert things[1][1] == {'z'}
+    assert isinstance(things[1][0], BNode)
+
+
+
+def test_streaming_names_blank_nodes_without_remembering_them(factory):
+    lines = ['_:b%d <http://rossfenning.co.uk/#knows> _:b%d .' % (i, i + 1) for i in range(100)]
+    f = io.BytesIO('\n'.join(lines).encode('utf-8'))
+
+    links = [(thing._id, thing.rf_knows.first()._id) for thing in factory.stream(f)]
+    again = next(factory.stream(io.BytesIO(f.getvalue())))
+
+    assert [obj for (_, obj) in links[:-1]] == [subj for (subj, _) in links[1:]]
+    assert again._id != links[0][0]
+
+def test_thing_to_dict_nests_and_references(factory):
+    factory('foaf_name', rdf_type=[factory('owl_FunctionalProperty')])
+    ross = factory('rf_me', foaf_name='Ross', rf_likes=['Cheese', 'Beer'])
+    alice = factory('rf_alice', foaf_name='Alice')
+    ross.foaf_knows.add(alice)
+    alice.foaf_knows.add(ross)
+
+    data = ross.to_dict(depth=2)
+
+    assert data['@id'] == 'http://rossfenning.co.uk/#me'
+    assert data['foaf_name'] == 'Ross'
+    assert set(data['rf_likes']) == {'Cheese', 'Beer'}
+    assert data['foaf_knows'] == [{'@id': 'http://rossfenning.co.uk/#alice', 'foaf_name': 'Alice',
+                                   'foaf_knows': [{'@id': 'http://rossfenning.co.uk/#me'}]}]
+    assert ross.to_dict(include=['foaf_name']) == {'@id': 'http://rossfenning.co.uk/#me',
+                                                   'foaf_name': 'Ross'}
+
+
+def test_thing_to_dict_names_aliases_and_languages(factory):
+    factory.addAlias('nick', 'http://xmlns.com/foaf/0.1/nick')
+    dog = factory('rf_dog', foaf_nick=['Rex'])
+    dog.rdfs_label.add('Dog', lang='en')
+    dog.rdfs_label.add('Chien', lang='fr')
+    factory.store.add((dog._id, URIRef('http://example.com/other#thing'), Literal(1)))
+
+    data = dog.to_dict(lang='fr')
+
+    assert data['nick'] == ['Rex']
+    assert data['http://example.com/other#thing'] == [1]
+    assert [str(label) for label in data['rdfs_label']] == ['Chien']
+
+
+def test_writing_things_as_jsonld(factory):
+    factory('foaf_name', rdf_type=[factory('owl_FunctionalProperty')])
+    ross = factory('rf_me', foaf_name='Ross', rf_age=[37], rf_likes=['Cheese'])
+    ross.rdf_type.add(factory('foaf_Person'))
+    ross.rdfs_label.add('Ross', lang='en')
+    ross.foaf_knows.add(factory(None, foaf_name='Alice'))
+    f = io.StringIO()
+
+    factory.write_jsonld(f, [ross], depth=1)
+    pytest.importorskip('rdflib.plugins.parsers.jsonld')
+    parsed = Graph().parse(data=f.getvalue(), format='json-ld')
+
+    expected = Graph()
+    for triple in factory.store.triples((None, None, None)):
+        if triple[0] != URIRef('http://xmlns.com/foaf/0.1/name'):
+            expected.add(triple)
+    assert to_isomorphic(parsed) == to_isomorphic(expected)
+
+
+def test_writing_non_finite_numbers_and_typed_list_members_as_jsonld(factory):
+    factory('rf_dates', rdf_type=[factory('owl_FunctionalProperty')],
+            rdfs_range=[factory('rdf_List')])
+    ross = factory('rf_me', rf_score=[float('nan'), float('inf'), 1.5])
+    ross.rf_dates = [Literal('2020-01-02', datatype=XSD.date), Literal('Hi', lang='en')]
+    f = io.StringIO()
+
+    factory.write_jsonld(f, [ross])
+    node = json.loads(f.getvalue())['@graph'][0]
+
+    assert sorted(node['rf:score'], key=str) == [
+        1.5, {'@value': 'INF', '@type': 'xsd:double'}, {'@value': 'NaN', '@type': 'xsd:double'}]
+    assert node['rf:dates'] == {'@list': [{'@value': '2020-01-02', '@type': 'xsd:date'},
+                                          {'@value': 'Hi', '@language': 'en'}]}
+
+
+def test_snapshot_reads_a_thing_in_one_scan(store):
+    factory = ThingFactory(store, compile_schema=True)
+    factory('foaf_name', rdf_type=[factory('owl_FunctionalProperty')])
+    ross = factory('rf_me', foaf_name='Ross', rf_likes=['Cheese', 'Beer'])
+    alice = factory('rf_alice', foaf_knows=[ross])
+    stats = factory.enable_stats()
+
+    page = ross.snapshot(inverse=True)
+    calls = sum(stats.snapshot()['store_calls'].values())
+
+    assert page['foaf_name'] == 'Ross'
+    assert page['foaf_name'] == 'Ross'
+    assert page[URIRef('http://xmlns.com/foaf/0.1/name')] == 'Ross'
+    assert set(page['rf_likes']) == {'Cheese', 'Beer'}
+    assert 'rf_nothing' not in page
+    assert calls == 2
+    assert sum(stats.snapshot()['store_calls'].values()) == calls
+    assert [thing._id for thing in page['foaf_knows_of']] == [alice._id]
+    with pytest.raises(TypeError):
+        page['foaf_name'] = 'Bob'
+
+
+def test_snapshot_reads_the_types_of_linked_nodes_once(store):
+    factory = ThingFactory(store, compile_schema=True)
+    friends = [factory('rf_friend%d' % i) for i in range(3)]
+    todo = factory('rf_todo', rdf_type=[factory('rdf_List')])
+    store.add((todo._id, RDF.first, Literal('Wash')))
+    store.add((todo._id, RDF.rest, RDF.nil))
+    ross = factory('rf_me', foaf_knows=friends, rf_todo=[todo])
+    stats = factory.enable_stats()
+
+    page = ross.snapshot()
+
+    assert set(thing._id for thing in page['foaf_knows']) == set(f._id for f in friends)
+    assert page['rf_todo'] == (['Wash'],)
+    calls = stats.snapshot()['store_calls']
+    assert calls['?PO'] == 2
+    assert 'SP?' not in calls
+
+
+def test_snapshot_leaves_its_thing_reading_the_store(store):
+    factory = ThingFactory(store, intern=True)
+    factory('foaf_gender', rdf_type=[factory('owl_FunctionalProperty')])
+    ross = factory('rf_me', foaf_gender='male', rf_likes=['Cheese'])
+    assert dict(ross.items()) == {'foaf_gender': 'male', 'rf_likes': ('Cheese',)}
+
+    store.set((ross._id, URIRef('http://xmlns.com/foaf/0.1/gender'), Literal('female')))
+    factory('rf_me').rf_likes.add('Beer')
+
+    assert ross.foaf_gender == 'female'
+    assert set(ross.rf_likes) == {'Cheese', 'Beer'}
+
+
+def test_snapshot_decides_restricted_cardinality_from_its_scan(store):
+    factory = ThingFactory(store, compile_schema=True)
+    restriction = factory(None, rdf_type=[factory('owl_Restriction')],
+                          owl_onProperty=[factory('rf_age')])
+    restriction.owl_maxCardinality.add('1')
+    factory('rf_Person', rdfs_subClassOf=[restriction])
+    ross = factory('rf_me', rdf_type=[factory('rf_Person')])
+    ross.rf_age = 33
+    stats = factory.enable_stats()
+
+    page = ross.snapshot()
+
+    assert page['rf_age'] == 33
+    assert stats.snapshot()['store_calls'] == {'S??': 1}
+
+
+def test_read_cache_answers_repeated_reads(store):
+    factory = ThingFactory(store, cache=True, compile_schema=True)
+    factory('foaf_name', rdf_type=[factory('owl_FunctionalProperty')])
+    factory('rf_todo', rdf_type=[factory('owl_FunctionalProperty')],
+            rdfs_range=[factory('rdf_List')])
+    ross = factory('rf_me', foaf_name='Ross')
+    ross.rf_todo = ['a', 'b']
+    stats = factory.enable_stats()
+
+    for _ in range(5):
+        assert ross.foaf_name == 'Ross'
+    todo = ross.rf_todo
+    todo.append('c')
+
+    assert ross.rf_todo == ['a', 'b']
+    assert stats.snapshot()['store_calls']['SP?'] == 2
+    assert stats.snapshot()['cache_hits']['reads'] == 5
+
+
+def test_read_cache_sees_writes(tracked_store):
+    store = tracked_store
+    factory = ThingFactory(store, cache=True)
+    factory('foaf_name', rdf_type=[factory('owl_FunctionalProperty')])
+    ross = factory('rf_me', foaf_name='Ross')
+    assert ross.foaf_name == 'Ross'
+
+    ross.foaf_name = 'Ross F'
+    assert ross.foaf_name == 'Ross F'
+
+    store.set((ross._id, URIRef('http://xmlns.com/foaf/0.1/name'), Literal('R')))
+    assert ross.foaf_name == 'R'
+
+    del ross.foaf_name
+    with pytest.raises(AttributeError):
+        ross.foaf_name
+
+    ross.rf_likes.add('Cheese')
+    assert set(ross.rf_likes) == {'Cheese'}
+
+
+
+def test_read_cache_is_not_filled_from_prefetched_values(tracked_store):
+    store = tracked_store
+    factory = ThingFactory(store, cache=True)
+    factory('foaf_name', rdf_type=[factory('owl_FunctionalProperty')])
+    ross = factory('rf_me', foaf_name='Ross')
+    factory.prefetch([ross], ['foaf_name', 'rdf_type'])
+
+    store.set((ross._id, URIRef('http://xmlns.com/foaf/0.1/name'), Literal('R')))
+    assert ross.foaf_name == 'Ross'
+
+    assert factory('rf_me').foaf_name == 'R'
+
+def test_read_cache_forgets_discarded_batch(store):
+    factory = ThingFactory(store, cache=True)
+    factory('foaf_gender', rdf_type=[factory('owl_FunctionalProperty')])
+    x = factory('rf_x', foaf_gender='male')
+
+    with pytest.raises(RuntimeError):
+        with factory.batch():
+            x.foaf_gender = 'female'
+            assert x.foaf_gender == 'female'
+            raise RuntimeError
+
+    assert x.foaf_gender == 'male'
+
+
+def test_read_cache_does_not_share_a_threads_batch(store):
+    factory = ThingFactory(store, cache=True, threadsafe=True)
+    factory('foaf_gender', rdf_type=[factory('owl_FunctionalProperty')])
+    x = factory('rf_x', foaf_gender='male')
+    seen = []
+
+    def read():
+        seen.append(x.foaf_gender)
+
+    with pytest.raises(RuntimeError):
+        with factory.batch():
+            x.foaf_gender = 'female'
+            assert x.foaf_gender == 'female'
+            reader = threading.Thread(target=read)
+            reader.start()
+            reader.join()
+            raise RuntimeError
+    read()
+
+    assert seen == ['male', 'male']
+
+
+def test_read_cache_sees_writes_through_other_graphs_on_the_store(tracked_store):
+    store = tracked_store
+    factory = ThingFactory(store, cache=True)
+    factory('foaf_name', rdf_type=[factory('owl_FunctionalProperty')])
+    ross = factory('rf_me', foaf_name='Ross')
+    assert ross.foaf_name == 'Ross'
+
+    Graph(store=store.store, identifier=store.identifier).set((ross._id, URIRef('http://xmlns.com/foaf/0.1/name'), Literal('R')))
+
+    assert ross.foaf_name == 'R'
+
+
+def test_read_cache_needs_telling_of_writes_to_an_untracked_store(store):
+    factory = ThingFactory(store, cache=True)
+    factory('foaf_name', rdf_type=[factory('owl_FunctionalProperty')])
+    ross = factory('rf_me', foaf_name='Ross')
+    assert ross.foaf_name == 'Ross'
+
+    store.set((ross._id, URIRef('http://xmlns.com/foaf/0.1/name'), Literal('R')))
+    assert ross.foaf_name == 'Ross'
+
+    factory.invalidate_cache()
+    assert ross.foaf_name == 'R'
+
+
+@pytest.mark.parametrize('cache', [False, True])
+def test_schema_parsed_into_a_tracked_store_is_seen(tracked_store, cache):
+    factory = ThingFactory(tracked_store, cache=cache)
+    ross = factory('rf_me', foaf_gender=['male'])
+    assert isinstance(ross.foaf_gender, ResourceSet)
+
+    tracked_store.parse(data='<http://xmlns.com/foaf/0.1/gender> a '
+                             '<http://www.w3.org/2002/07/owl#FunctionalProperty> .', format='turtle')
+
+    assert ross.foaf_gender == 'male'